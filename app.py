@@ -1,10 +1,43 @@
 import os
+import copy
+import gzip
+import hashlib
+import heapq
 import json
+import math
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Optional, Sequence
 
 import requests
-from flask import Flask, request, jsonify
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python helpers are used without it
+    np = None
+try:
+    import orjson
+except ImportError:  # optional faster JSON encoder; the stdlib encoder is used without it
+    orjson = None
+try:
+    import brotli
+except ImportError:  # optional; responses are only gzip-compressed without it
+    brotli = None
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
 from openai import OpenAI
 from flask_cors import CORS   # ✅ NEW: CORS support
@@ -21,19 +54,141 @@ CORS(app)   # ✅ NEW: Allow frontend on https://lovable.dev to access your back
 # ------------ Config from env ------------ #
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY", "")
+# Point at a local stand-in (benchmarks/stub_server.py) to run without spending quota
+GOOGLE_MAPS_BASE_URL = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com").rstrip("/")
 DEFAULT_PLACES_RADIUS_KM = int(os.getenv("DEFAULT_PLACES_RADIUS_KM", "10"))
 ROUTE_SAMPLING_STEP = int(os.getenv("ROUTE_SAMPLING_STEP", "10"))
+# "distance" places query centres evenly along the route; "step" keeps every Nth vertex
+ROUTE_SAMPLING_MODE = os.getenv("ROUTE_SAMPLING_MODE", "distance")
+# Fraction of each search circle's diameter shared with the next one along the route
+ROUTE_SAMPLING_OVERLAP = float(os.getenv("ROUTE_SAMPLING_OVERLAP", "0.25"))
+# Grid cell size of the route index used to place stops along the route; 0 = a quarter of the search radius
+ROUTE_INDEX_CELL_KM = float(os.getenv("ROUTE_INDEX_CELL_KM", "0"))
 REQUEST_TIMEOUT_SECONDS = int(os.getenv("REQUEST_TIMEOUT_SECONDS", "10"))
 
+# Process-wide token-bucket rate limits per Google API, in requests/second (0 = unlimited)
+GEOCODE_QPS = float(os.getenv("GEOCODE_QPS", "50"))
+DIRECTIONS_QPS = float(os.getenv("DIRECTIONS_QPS", "50"))
+PLACES_QPS = float(os.getenv("PLACES_QPS", "50"))
+# Upper bound on Nearby Search calls for one trip; sample spacing is widened to stay under it
+MAX_PLACES_CALLS_PER_TRIP = int(os.getenv("MAX_PLACES_CALLS_PER_TRIP", "120"))
+
+# Hedged requests: comma-separated APIs (e.g. "places,geocode") that get a duplicate call when the
+# first is slower than the HEDGE_PERCENTILE latency seen recently ("" disables hedging)
+HEDGE_APIS = {a.strip() for a in os.getenv("HEDGE_APIS", "").split(",") if a.strip()}
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breaker per upstream API: opens when the error rate over the window crosses the
+# threshold (0 disables), fails fast while open and lets one probe through after the cool-down
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "20"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+
+# Default overall time budget for one trip when the request has no max_latency_ms (0 = none)
+TRIP_MAX_LATENCY_MS = int(os.getenv("TRIP_MAX_LATENCY_MS", "0"))
+
+# Server-Timing header on /plan-trip responses ("1" = always, else only with ?server_timing=1)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Response encoding: orjson when installed ("0" keeps the stdlib encoder), and gzip/brotli for
+# JSON bodies of at least COMPRESS_MIN_BYTES when the client accepts it (0 disables compression)
+FAST_JSON = os.getenv("FAST_JSON", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+# Shared HTTP client: keep-alive pool per host, retries with jittered backoff on 429/5xx/timeouts
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_SECONDS = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.3"))
+HTTP_BACKOFF_JITTER_SECONDS = float(os.getenv("HTTP_BACKOFF_JITTER_SECONDS", "0.2"))
+
+# Places fan-out: size of the shared worker pool and how many calls one trip may have in flight
+PLACES_MAX_WORKERS = int(os.getenv("PLACES_MAX_WORKERS", "16"))
+PLACES_CONCURRENCY = int(os.getenv("PLACES_CONCURRENCY", "8"))
+
+# Query planner: preferences sending the same Places query share one sweep, and keyword
+# preferences also take client-side matches from their type's unfiltered sweep ("0" disables)
+PLANNER_SHARED_QUERIES = os.getenv("PLANNER_SHARED_QUERIES", "1") == "1"
+
+# Stops kept per category when the request does not set max_stops_per_category (0 = all)
+MAX_STOPS_PER_CATEGORY = int(os.getenv("MAX_STOPS_PER_CATEGORY", "0"))
+# Stop ranking: ratings are pulled towards RANK_PRIOR_RATING until a place has about
+# RANK_PRIOR_REVIEWS reviews, and each km off the route costs RANK_DETOUR_PENALTY stars
+RANK_PRIOR_RATING = float(os.getenv("RANK_PRIOR_RATING", "3.5"))
+RANK_PRIOR_REVIEWS = int(os.getenv("RANK_PRIOR_REVIEWS", "50"))
+RANK_DETOUR_PENALTY = float(os.getenv("RANK_DETOUR_PENALTY", "0.1"))
+# With max_stops_per_category, a query's sweep stops once each of its categories has that many
+# places rated RANK_CUTOFF_RATING or better from at least RANK_CUTOFF_REVIEWS reviews
+RANK_CUTOFF_RATING = float(os.getenv("RANK_CUTOFF_RATING", "4.3"))
+RANK_CUTOFF_REVIEWS = int(os.getenv("RANK_CUTOFF_REVIEWS", "100"))
+
 ALLOWED_RADII_KM = [5, 10, 15, 25, 50]
 
+# Background trip-planning jobs (POST /jobs)
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "900"))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "500"))
+
+# Batch planning (POST /plan-trips): trips per request and how many run at once
+BATCH_MAX_TRIPS = int(os.getenv("BATCH_MAX_TRIPS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Geocode cache: in-process LRU in front of an on-disk SQLite store ("" disables the disk tier)
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "2048"))
+GEOCODE_CACHE_TTL_SECONDS = int(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL_SECONDS = int(os.getenv("GEOCODE_NEGATIVE_TTL_SECONDS", "3600"))
+
+# Nearby Search cache: query centres snap to geohash cells (precision 0 = pick from the radius)
+PLACES_CACHE_GEOHASH_PRECISION = int(os.getenv("PLACES_CACHE_GEOHASH_PRECISION", "0"))
+PLACES_CACHE_MAX_ENTRIES = int(os.getenv("PLACES_CACHE_MAX_ENTRIES", "5000"))
+PLACES_CACHE_TTL_SECONDS = int(os.getenv("PLACES_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Directions cache: coordinates rounded to ROUTE_CACHE_PRECISION decimals (4 ≈ 11 m)
+ROUTE_CACHE_PRECISION = int(os.getenv("ROUTE_CACHE_PRECISION", "4"))
+ROUTE_CACHE_MAX_BYTES = int(os.getenv("ROUTE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ROUTE_CACHE_TTL_SECONDS = int(os.getenv("ROUTE_CACHE_TTL_SECONDS", str(6 * 3600)))
+
 # OpenAI (ChatGPT) config
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")   # safe default model
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "") or None   # None = api.openai.com
 MAX_AI_PLACES_PER_CATEGORY = int(os.getenv("MAX_AI_PLACES_PER_CATEGORY", "3"))
+# Completions run in parallel up to AI_CONCURRENCY; each gets AI_CALL_TIMEOUT_SECONDS
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "8"))
+AI_CALL_TIMEOUT_SECONDS = float(os.getenv("AI_CALL_TIMEOUT_SECONDS", "20"))
+
+# AI description cache: LRU over a size-capped SQLite store ("" disables the disk tier)
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "ai_cache.sqlite3")
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "50000"))
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "2048"))
+# Optional JSON file of [{"place_id", "category", "ai_details"}, ...] loaded at startup
+AI_CACHE_WARMUP_FILE = os.getenv("AI_CACHE_WARMUP_FILE", "")
+
+# "per_place" sends one prompt per place; "batch" sends one JSON prompt per trip or per category
+AI_ENRICHMENT_MODE = os.getenv("AI_ENRICHMENT_MODE", "per_place")
+AI_BATCH_SCOPE = os.getenv("AI_BATCH_SCOPE", "trip")
+AI_BATCH_TIMEOUT_SECONDS = float(os.getenv("AI_BATCH_TIMEOUT_SECONDS", "60"))
+
+
+def build_openai_client(api_key: str = OPENAI_API_KEY, base_url: Optional[str] = OPENAI_BASE_URL) -> OpenAI:
+    """OpenAI client without SDK retries, so a call's timeout bounds how long it takes."""
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
 
 openai_enabled = bool(OPENAI_API_KEY)
-openai_client: Optional[OpenAI] = OpenAI(api_key=OPENAI_API_KEY) if openai_enabled else None
+openai_client: Optional[OpenAI] = build_openai_client() if openai_enabled else None
+
+# Shared pool for upstream Places calls, bounded across all in-flight trips
+_places_executor = ThreadPoolExecutor(max_workers=PLACES_MAX_WORKERS, thread_name_prefix="places")
+# Shared pool for OpenAI completions; its size is the process-wide AI concurrency cap
+_ai_executor = ThreadPoolExecutor(max_workers=AI_CONCURRENCY, thread_name_prefix="ai")
 
 # Category mapping for user preferences → Google Places search parameters
 CATEGORY_MAPPING: Dict[str, Dict[str, Any]] = {
@@ -103,6 +258,80 @@ def decode_polyline(polyline_str: str) -> List[Tuple[float, float]]:
     return coords
 
 
+def encode_polyline(points) -> str:
+    """Encode (lat, lng) pairs as a Google encoded polyline (inverse of decode_polyline)."""
+    out = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        ilat, ilng = round(lat * 1e5), round(lng * 1e5)
+        for delta in (ilat - prev_lat, ilng - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lng = ilat, ilng
+    return "".join(out)
+
+
+# Longest varint decodable in int64 without overflow (12 chunks * 5 bits = 60 bits)
+_MAX_VARINT_CHARS = 12
+
+
+def decode_polylines(polyline_strs: List[str]) -> List[Any]:
+    """Decode many polylines with NumPy into (N, 2) arrays identical to decode_polyline()'s."""
+    if np is None:
+        raise RuntimeError("NumPy is required for decode_polylines")
+
+    encoded = [s.encode("utf-32-le") if s else b"" for s in polyline_strs]
+    lengths = np.array([len(e) // 4 for e in encoded], dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return [np.empty((0, 2), dtype=np.float64) for _ in polyline_strs]
+
+    codes = np.frombuffer(b"".join(encoded), dtype="<u4").astype(np.int64) - 63
+    string_ends = np.cumsum(lengths)
+
+    # A varint ends at a byte below 0x20, or where its polyline runs out
+    is_end = codes < 0x20
+    is_end[string_ends[lengths > 0] - 1] = True
+    ends = np.flatnonzero(is_end)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group_len = ends - starts + 1
+    if group_len.max() > _MAX_VARINT_CHARS:
+        return [np.array(decode_polyline(s), dtype=np.float64).reshape(-1, 2) for s in polyline_strs]
+
+    shift = 5 * (np.arange(total) - np.repeat(starts, group_len))
+    values = np.add.reduceat((codes & 0x1F) << shift, starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    # Varints per polyline; an odd count means the last longitude is missing (decoded as 0)
+    groups_per_string = np.diff(np.concatenate(([0], np.searchsorted(ends, string_ends - 1, side="right"))))
+    odd = np.flatnonzero(groups_per_string % 2)
+    if len(odd):
+        insert_at = np.cumsum(groups_per_string)[odd]
+        deltas = np.insert(deltas, insert_at, 0)
+    if np.abs(deltas).max() > 2 ** 40:
+        return [np.array(decode_polyline(s), dtype=np.float64).reshape(-1, 2) for s in polyline_strs]
+
+    pairs_per_string = (groups_per_string + 1) // 2
+    sums = np.cumsum(deltas.reshape(-1, 2), axis=0)
+
+    # Restart the running sums at each polyline boundary
+    first_pair = np.concatenate(([0], np.cumsum(pairs_per_string)[:-1]))
+    base = np.zeros((len(polyline_strs), 2), dtype=np.int64)
+    has_prev = first_pair > 0
+    base[has_prev] = sums[first_pair[has_prev] - 1]
+    coords = (sums - np.repeat(base, pairs_per_string, axis=0)) / 1e5
+
+    return np.split(coords, np.cumsum(pairs_per_string)[:-1])
+
+
+def decode_polyline_array(polyline_str: str):
+    """NumPy version of decode_polyline: a contiguous (N, 2) float64 array of (lat, lng)."""
+    return decode_polylines([polyline_str])[0]
+
+
 def build_maps_url(place_id: str) -> str:
     """Return Google Maps deep link for a place."""
     return f"https://www.google.com/maps/place/?q=place_id:{place_id}"
@@ -122,53 +351,1058 @@ def map_vehicle_to_mode(vehicle_type: str) -> str:
     return "driving"
 
 
+# --------- Metrics --------- #
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    """Prometheus counter with labels."""
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(zip(self.label_names, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    """Prometheus histogram with labels and fixed buckets (seconds)."""
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List[float]] = {}   # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = dict(zip(self.label_names, key))
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """Metric read at scrape time from `collect()`, which returns [(labels, value), ...]."""
+
+    def __init__(self, name: str, help_text: str, metric_type: str, collect):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+METRICS: List[Any] = []
+
+
+def register_metric(metric):
+    METRICS.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = register_metric(Histogram(
+    "trip_stage_seconds", "Time spent in each /plan-trip stage.", ["stage"]))
+TRIP_SECONDS = register_metric(Histogram(
+    "plan_trip_seconds", "End-to-end /plan-trip pipeline time by outcome.", ["outcome"]))
+UPSTREAM_SECONDS = register_metric(Histogram(
+    "upstream_request_seconds", "Latency of calls to external APIs.", ["api"]))
+UPSTREAM_REQUESTS = register_metric(Counter(
+    "upstream_requests_total", "Calls to external APIs by HTTP status ('error' = no response).",
+    ["api", "status"]))
+UPSTREAM_HEDGES = register_metric(Counter(
+    "upstream_hedges_total", "Hedged calls: sent, won (hedge answered first), lost, or skipped (no rate budget).",
+    ["api", "result"]))
+BREAKER_TRANSITIONS = register_metric(Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes by upstream API.", ["api", "state"]))
+STALE_SERVED = register_metric(Counter(
+    "stale_cache_served_total", "Expired cache entries served because the upstream was unavailable.",
+    ["cache"]))
+
+
+def _record_timing(stage: str, seconds: float) -> None:
+    """Feed a finished span to the stage histogram and, in a request, to Server-Timing."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if has_request_context():
+        timings = g.setdefault("server_timing", [])
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Time a block as a /plan-trip stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_timing(stage, time.perf_counter() - started)
+
+
+def record_upstream(api: str, status, seconds: float) -> None:
+    UPSTREAM_REQUESTS.inc(api=api, status=status)
+    UPSTREAM_SECONDS.observe(seconds, api=api)
+
+
+# --------- HTTP client --------- #
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def build_http_session(retries: int = HTTP_MAX_RETRIES) -> requests.Session:
+    """Session with a pooled keep-alive adapter and retries on 429/5xx, timeouts and resets."""
+    retry_kwargs = dict(
+        total=retries,
+        backoff_factor=HTTP_BACKOFF_SECONDS,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,   # hand the final 429/5xx back to the caller's status checks
+    )
+    try:
+        retry = Retry(backoff_jitter=HTTP_BACKOFF_JITTER_SECONDS, **retry_kwargs)
+    except TypeError:  # urllib3 < 2 has no backoff_jitter
+        retry = Retry(**retry_kwargs)
+
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE,
+                          max_retries=retry, pool_block=False)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+http_session = build_http_session()
+# Calls under a trip deadline: _send retries them itself, only while the deadline allows
+http_session_no_retries = build_http_session(retries=0)
+
+
+class UpstreamRateLimited(RuntimeError):
+    """Raised when an upstream's token bucket has no capacity within the request timeout."""
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Raised without calling out when an upstream's circuit breaker is open."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """Take one token, waiting up to `timeout` seconds. Returns False if none came free."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_for = (1 - self._tokens) / self.rate
+            if now + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a trip's time budget runs out before an upstream call could start."""
+
+
+class Deadline:
+    """Absolute time budget for one trip, handed down to every stage that waits on I/O."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when there is no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cap(self, seconds: float) -> float:
+        """`seconds` shortened to the time left."""
+        left = self.remaining()
+        return seconds if left is None else min(seconds, left)
+
+    def timeout(self, seconds: float) -> float:
+        """Like cap(), but raises DeadlineExceeded when no time is left."""
+        left = self.cap(seconds)
+        if left <= 0:
+            raise DeadlineExceeded("Trip deadline exceeded")
+        return left
+
+
+class FlightDeadline(Deadline):
+    """
+    The deadline a coalesced upstream call runs under: the loosest of its
+    callers' deadlines. Callers that join can only extend it, or lift it.
+    """
+
+    def __init__(self, deadline: Optional[Deadline] = None):
+        super().__init__()
+        self.expires_at = deadline.expires_at if deadline is not None else None
+
+    def extend(self, deadline: Optional[Deadline]) -> None:
+        if self.expires_at is None:
+            return
+        expires_at = deadline.expires_at if deadline is not None else None
+        self.expires_at = None if expires_at is None else max(self.expires_at, expires_at)
+
+
+def request_timeout(deadline: Optional[Deadline] = None) -> float:
+    """Per-call HTTP timeout: REQUEST_TIMEOUT_SECONDS, cut short by the trip deadline."""
+    return deadline.timeout(REQUEST_TIMEOUT_SECONDS) if deadline is not None else REQUEST_TIMEOUT_SECONDS
+
+
+def retry_backoff(attempt: int, deadline: Optional[Deadline] = None) -> Optional[float]:
+    """Jittered backoff after failed attempt `attempt`, or None if no retry is left before the deadline."""
+    if attempt >= HTTP_MAX_RETRIES:
+        return None
+    backoff = HTTP_BACKOFF_SECONDS * 2 ** attempt + random.uniform(0, HTTP_BACKOFF_JITTER_SECONDS)
+    if deadline is not None and deadline.cap(backoff) < backoff:
+        return None
+    return backoff
+
+
+class CircuitBreaker:
+    """
+    Per-upstream breaker: opens at `error_rate` over a sliding window, then after `open_seconds`
+    lets one probe through, whose outcome (not that of older calls) closes or reopens it.
+    """
+
+    def __init__(self, api: str, error_rate: float, min_requests: int,
+                 window_seconds: float, open_seconds: float):
+        self.api = api
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes = deque()   # (monotonic time, ok)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open":
+                if now - self._opened_at < self.open_seconds:
+                    return False
+                self._transition("half_open")
+            # A probe that never reported back (e.g. it was rate-limited) is replaced after a cool-down
+            if self._probe_started is not None and now - self._probe_started < self.open_seconds:
+                return False
+            self._probe_started = now
+            return True
+
+    def record(self, ok: bool, started: Optional[float] = None) -> None:
+        """Outcome of a call that started at monotonic time `started` (default now)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half_open":
+                if self._probe_started is None or (started if started is not None else now) < self._probe_started:
+                    return   # a straggler from before the breaker opened, not the probe
+                self._probe_started = None
+                if ok:
+                    self._outcomes.clear()
+                    self._failures = 0
+                    self._transition("closed")
+                else:
+                    self._open(now)
+                return
+            if self.state == "open":
+                return   # a straggler from before the breaker opened
+
+            self._outcomes.append((now, ok))
+            self._failures += not ok
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._failures -= not self._outcomes.popleft()[1]
+            if (len(self._outcomes) >= self.min_requests
+                    and self._failures / len(self._outcomes) >= self.error_rate):
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self._opened_at = now
+        self._transition("open")
+        app.logger.warning("Circuit breaker for %s opened for %.0f s", self.api, self.open_seconds)
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        BREAKER_TRANSITIONS.inc(api=self.api, state=state)
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls to one upstream, for hedge delays."""
+
+    def __init__(self, size: int = 256):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if len(self._values) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+UPSTREAM_APIS = ("geocode", "directions", "places")
+
+rate_limiters: Dict[str, TokenBucket] = {
+    api: TokenBucket(qps)
+    for api, qps in zip(UPSTREAM_APIS, (GEOCODE_QPS, DIRECTIONS_QPS, PLACES_QPS))
+    if qps > 0
+}
+circuit_breakers: Dict[str, CircuitBreaker] = {
+    api: CircuitBreaker(api, BREAKER_ERROR_RATE, BREAKER_MIN_REQUESTS,
+                        BREAKER_WINDOW_SECONDS, BREAKER_OPEN_SECONDS)
+    for api in UPSTREAM_APIS
+    if BREAKER_ERROR_RATE > 0
+}
+latency_windows: Dict[str, LatencyWindow] = {api: LatencyWindow() for api in HEDGE_APIS}
+
+# Hedged calls run both attempts here so the caller can take whichever answers first
+_hedge_executor = ThreadPoolExecutor(max_workers=2 * max(PLACES_MAX_WORKERS, HTTP_POOL_SIZE),
+                                     thread_name_prefix="hedge")
+
+
+def http_get(url: str, params: Dict[str, Any], api: str = "other",
+             timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> requests.Response:
+    """
+    GET through the shared session with metrics, circuit breaker, rate limit and hedging;
+    a deadline bounds the timeout and the retries.
+    """
+    if timeout is None:
+        timeout = request_timeout(deadline)
+    breaker = circuit_breakers.get(api)
+    if breaker is not None and not breaker.allow():
+        record_upstream(api, "circuit_open", 0.0)
+        raise UpstreamUnavailable(f"{api} is unavailable (circuit breaker open)")
+
+    started = time.perf_counter()
+    limiter = rate_limiters.get(api)
+    if limiter is not None and not limiter.acquire(timeout):
+        record_upstream(api, "rate_limited", time.perf_counter() - started)
+        raise UpstreamRateLimited(f"{api} rate limit exceeded")
+
+    if api in latency_windows:
+        return _hedged_send(url, params, api, timeout, deadline)
+    return _send(url, params, api, timeout, deadline)
+
+
+def _send(url: str, params: Dict[str, Any], api: str, timeout: float,
+          deadline: Optional[Deadline] = None) -> requests.Response:
+    """One upstream call via observe_attempt; under a deadline, retried only while retry_backoff allows."""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        if deadline is None or deadline.expires_at is None:
+            resp = http_session.get(url, params=params, timeout=timeout)
+            status = resp.status_code
+            return resp
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            try:
+                resp = http_session_no_retries.get(url, params=params,
+                                                   timeout=timeout if attempt == 0 else request_timeout(deadline))
+            except (requests.ConnectionError, requests.Timeout):
+                backoff = retry_backoff(attempt, deadline)
+                if backoff is None:
+                    raise
+            else:
+                status = resp.status_code
+                backoff = retry_backoff(attempt, deadline) if status in RETRY_STATUS_CODES else None
+                if backoff is None:
+                    return resp
+            time.sleep(backoff)
+    finally:
+        observe_attempt(api, status, time.perf_counter() - started)
+
+
+def observe_attempt(api: str, status, seconds: float) -> None:
+    """Feed one upstream attempt to the metrics, the circuit breaker and the hedge latency window."""
+    record_upstream(api, status, seconds)
+    ok = status != "error" and status < 500 and status != 429
+    breaker = circuit_breakers.get(api)
+    if breaker is not None:
+        breaker.record(ok, time.monotonic() - seconds)
+    if ok and api in latency_windows:
+        latency_windows[api].add(seconds)
+
+
+def _hedged_send(url: str, params: Dict[str, Any], api: str, timeout: float,
+                 deadline: Optional[Deadline] = None) -> requests.Response:
+    """Send the call, and a duplicate once it is slower than the API's recent HEDGE_PERCENTILE latency."""
+    delay = latency_windows[api].percentile(HEDGE_PERCENTILE)
+    if delay is None:
+        return _send(url, params, api, timeout, deadline)
+
+    primary = _hedge_executor.submit(_send, url, params, api, timeout, deadline)
+    try:
+        return primary.result(timeout=max(delay, HEDGE_MIN_DELAY_MS / 1000))
+    except FuturesTimeoutError:
+        pass
+
+    # The duplicate must not wait for rate budget: skip it instead
+    limiter = rate_limiters.get(api)
+    if limiter is not None and not limiter.acquire(0):
+        UPSTREAM_HEDGES.inc(api=api, result="skipped")
+        return primary.result()
+
+    UPSTREAM_HEDGES.inc(api=api, result="sent")
+    hedge = _hedge_executor.submit(_send, url, params, api, timeout, deadline)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                resp = future.result()
+            except Exception as e:
+                error = e
+                continue
+            UPSTREAM_HEDGES.inc(api=api, result="won" if future is hedge else "lost")
+            return resp
+    raise error
+
+
+# --------- Request coalescing --------- #
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "deadline")
+
+    def __init__(self, deadline: Optional[FlightDeadline] = None):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.deadline = deadline
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key: the first caller runs fn, the others get its outcome."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: Dict[Any, _Flight] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def do_within(self, deadline: Optional[Deadline], key, fn, *args):
+        """
+        do() under a trip deadline: the call runs under its callers' loosest deadline (fn's last
+        argument), and each caller waits only until its own.
+        """
+        return self.join_within(deadline, key, fn, *args)[0]
+
+    def join_within(self, deadline: Optional[Deadline], key, fn, *args) -> Tuple[Any, bool]:
+        """do_within, returning (result, whether this caller joined a call another caller started)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(FlightDeadline(deadline))
+                self.executed += 1
+            else:
+                flight.deadline.extend(deadline)
+                self.coalesced += 1
+
+        if leader:
+            if flight.deadline.expires_at is None:
+                self._run(key, flight, fn, args)
+            else:
+                _flight_executor.submit(self._run, key, flight, fn, args)
+
+        if not flight.done.wait(deadline.remaining() if deadline is not None else None):
+            raise DeadlineExceeded("Trip deadline exceeded")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, not leader
+
+    def _run(self, key, flight: _Flight, fn, args) -> None:
+        try:
+            flight.result = fn(*args, flight.deadline)
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+# Coalesced upstream calls whose leader has a deadline run here, so the leader can stop waiting
+_flight_executor = ThreadPoolExecutor(max_workers=2 * max(PLACES_MAX_WORKERS, HTTP_POOL_SIZE),
+                                      thread_name_prefix="flight")
+
+geocode_flight = SingleFlight("geocode")
+route_flight = SingleFlight("directions")
+places_flight = SingleFlight("places")
+trip_flight = SingleFlight("plan_trip")
+
+
+# Groups reported by coalescing_stats() and /metrics; app_async.py swaps in its async groups
+flight_groups = [trip_flight, geocode_flight, route_flight, places_flight]
+
+
+def coalescing_stats() -> Dict[str, Dict[str, int]]:
+    """Executed vs coalesced call counts for every single-flight group."""
+    return {f.name: f.stats() for f in flight_groups}
+
+
+# --------- Caches --------- #
+
+class TTLCache:
+    """Thread-safe LRU cache with a TTL, bounded by entries and optionally by total `sizeof` bytes."""
+
+    def __init__(self, max_entries: Optional[int], ttl_seconds: float,
+                 max_bytes: Optional[int] = None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._sizes: Dict[Any, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= time.time():
+                # Kept until replaced or evicted so get_stale can fall back to it
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key, default=None):
+        """Return the entry for `key` even if it has expired (for use while an upstream is down)."""
+        with self._lock:
+            item = self._data.get(key)
+            return default if item is None else item[1]
+
+    def set(self, key, value, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.time() + ttl, value)
+            self._sizes[key] = size
+            self._bytes += size
+            while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key) -> None:
+        del self._data[key]
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        if self.sizeof:
+            stats["bytes"] = self._bytes
+        return stats
+
+
+class SQLiteCache:
+    """On-disk JSON key/value store with expiry and optional `max_entries`, opened on first use."""
+
+    PURGE_EVERY_WRITES = 256
+
+    def __init__(self, path: str, table: str, max_entries: Optional[int] = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        """The connection, opened (and the table created) on first use. Caller holds the lock."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            with conn:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+            self._conn = conn
+            with conn:
+                self._purge()
+        return self._conn
+
+    def _purge(self) -> None:
+        """Drop expired rows, then the oldest rows beyond max_entries. Caller holds the lock."""
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+        if self.max_entries is not None:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, expires_at) for a live entry, or None."""
+        with self._lock:
+            row = self._db().execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        with self._lock, self._db():
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl_seconds),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY_WRITES == 0:
+                self._purge()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def normalize_address(address: str) -> str:
+    """Canonical cache key for a free-text address: case, spacing and comma style ignored."""
+    text = unicodedata.normalize("NFKC", address or "").casefold()
+    text = re.sub(r"\s*,\s*", ", ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" ,.")
+
+
+class GeocodeCache:
+    """
+    Two-tier geocode cache: an LRU in front of an optional SQLite store.
+    Addresses Google could not resolve are cached separately with a shorter TTL.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.memory = TTLCache(max_entries, ttl_seconds)
+        self.disk = SQLiteCache(path, "geocode") if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, address: str) -> Optional[Dict[str, Any]]:
+        key = normalize_address(address)
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            found = self.disk.get(key)
+            if found is not None:
+                entry, expires_at = found
+                self.memory.set(key, entry, ttl_seconds=expires_at - time.time())
+                self.disk_hits += 1
+        elif entry is not None:
+            self.memory_hits += 1
+
+        if entry is None:
+            self.misses += 1
+        elif entry.get("not_found"):
+            self.negative_hits += 1
+        return entry
+
+    def set(self, address: str, lat: float, lng: float, formatted_address: str) -> None:
+        entry = {"lat": lat, "lng": lng, "formatted_address": formatted_address}
+        self._store(normalize_address(address), entry, self.ttl_seconds)
+
+    def set_not_found(self, address: str) -> None:
+        self._store(normalize_address(address), {"not_found": True}, self.negative_ttl_seconds)
+
+    def _store(self, key: str, entry: Dict[str, Any], ttl_seconds: float) -> None:
+        self.memory.set(key, entry, ttl_seconds=ttl_seconds)
+        if self.disk is not None:
+            self.disk.set(key, entry, ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+        }
+
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    """Standard base32 geohash of a point."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_center(geohash: str) -> Tuple[float, float]:
+    """Centre (lat, lng) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for ch in geohash:
+        value = _GEOHASH_ALPHABET.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return round((lat_lo + lat_hi) / 2, 6), round((lng_lo + lng_hi) / 2, 6)
+
+
+def places_geohash_precision(radius_meters: int) -> int:
+    """
+    Geohash precision used to snap query centres. Cells must be small next to
+    the search circle: ~4.9 km cells for radii of 20 km and up, ~1.2 km below.
+    """
+    if PLACES_CACHE_GEOHASH_PRECISION > 0:
+        return PLACES_CACHE_GEOHASH_PRECISION
+    return 5 if radius_meters >= 20000 else 6
+
+
+# Nearby Search results keyed by (geohash cell, type, keyword, radius)
+places_cache = TTLCache(PLACES_CACHE_MAX_ENTRIES, PLACES_CACHE_TTL_SECONDS)
+
+
+def _route_entry_size(entry: Dict[str, Any]) -> int:
+    """Approximate bytes held by a cached route: the coordinate buffer plus fixed overhead."""
+    polyline = entry["polyline"]
+    return polyline.itemsize * (polyline.size if np is not None and isinstance(polyline, np.ndarray)
+                                else len(polyline)) + 256
+
+
+def route_cache_key(start_coords, end_coords, mode: str, via_coords=None):
+    """Directions cache key: quantised endpoints, travel mode and the ordered via points."""
+    def q(coords):
+        return round(coords[0], ROUTE_CACHE_PRECISION), round(coords[1], ROUTE_CACHE_PRECISION)
+    return q(start_coords), q(end_coords), mode, tuple(q(v) for v in via_coords or ())
+
+
+# Decoded routes keyed by route_cache_key, bounded by ROUTE_CACHE_MAX_BYTES
+route_cache = TTLCache(None, ROUTE_CACHE_TTL_SECONDS,
+                       max_bytes=ROUTE_CACHE_MAX_BYTES, sizeof=_route_entry_size)
+
+
+geocode_cache = GeocodeCache(
+    GEOCODE_CACHE_PATH,
+    GEOCODE_CACHE_MAX_ENTRIES,
+    GEOCODE_CACHE_TTL_SECONDS,
+    GEOCODE_NEGATIVE_TTL_SECONDS,
+)
+
+
 # --------- External API wrappers --------- #
 
-def geocode_place(place: str) -> Tuple[Tuple[float, float], str]:
-    """Geocode using Google Maps API."""
+def geocode_place(place: str, deadline: Optional[Deadline] = None) -> Tuple[Tuple[float, float], str]:
+    """Geocode using Google Maps API, served from geocode_cache when possible."""
+    cached = geocode_cache_lookup(place)
+    if cached is not None:
+        return cached
+
+    # Concurrent misses for the same address share one upstream call
+    try:
+        return geocode_flight.do_within(deadline, normalize_address(place), _geocode_upstream, place)
+    except UpstreamUnavailable:
+        stale = stale_geocode(place)
+        if stale is None:
+            raise
+        return stale
+
+
+def geocode_cache_lookup(place: str) -> Optional[Tuple[Tuple[float, float], str]]:
+    """Cached (coords, formatted address) for a place, or None. Raises for a cached "not found"."""
+    cached = geocode_cache.get(place)
+    if cached is None:
+        return None
+    if cached.get("not_found"):
+        raise RuntimeError(f"Geocoding failed for: {place}")
+    return (cached["lat"], cached["lng"]), cached["formatted_address"]
+
+
+def stale_geocode(place: str) -> Optional[Tuple[Tuple[float, float], str]]:
+    """An expired geocode_cache answer, for use while the Geocoding API is unavailable."""
+    stale = geocode_cache.memory.get_stale(normalize_address(place))
+    if stale is None or stale.get("not_found"):
+        return None
+    STALE_SERVED.inc(cache="geocode")
+    return (stale["lat"], stale["lng"]), stale["formatted_address"]
+
+
+def _geocode_upstream(place: str, deadline: Optional[Deadline] = None) -> Tuple[Tuple[float, float], str]:
+    """Call the Geocoding API and record the answer in geocode_cache."""
+    url, params = geocode_request(place)
+    resp = http_get(url, params, api="geocode", deadline=deadline)
+    return geocode_answer(place, resp.status_code, resp.json() if resp.status_code == 200 else None)
+
+
+def geocode_request(place: str) -> Tuple[str, Dict[str, Any]]:
+    """URL and query parameters of a Geocoding API call."""
     if not GOOGLE_API_KEY:
         raise RuntimeError("GOOGLE_MAPS_API_KEY is not configured")
+    return f"{GOOGLE_MAPS_BASE_URL}/maps/api/geocode/json", {"address": place, "key": GOOGLE_API_KEY}
 
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {"address": place, "key": GOOGLE_API_KEY}
-    resp = requests.get(url, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
 
-    if resp.status_code != 200:
-        raise RuntimeError(f"Geocoding failed with status {resp.status_code}")
+def geocode_answer(place: str, status_code: int, data) -> Tuple[Tuple[float, float], str]:
+    """Turn a Geocoding API response into (coords, formatted address), recording it in geocode_cache."""
+    if status_code != 200:
+        raise RuntimeError(f"Geocoding failed with status {status_code}")
 
-    data = resp.json()
+    if data.get("status") in ("OK", "ZERO_RESULTS") and not data.get("results"):
+        # Only a definitive "no such place" is cached; quota or server errors are retried
+        geocode_cache.set_not_found(place)
     if data.get("status") != "OK" or not data.get("results"):
         raise RuntimeError(f"Geocoding failed for: {place}")
 
     result = data["results"][0]
     loc = result["geometry"]["location"]
-    return (loc["lat"], loc["lng"]), result.get("formatted_address", place)
+    formatted = result.get("formatted_address", place)
+    geocode_cache.set(place, loc["lat"], loc["lng"], formatted)
+    return (loc["lat"], loc["lng"]), formatted
 
 
-def get_route(start_coords, end_coords, vehicle_type, via_coords=None):
+def _route_result(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Expand a cached route entry into the dict returned by get_route."""
+    polyline = entry["polyline"]
+    if np is None or not isinstance(polyline, np.ndarray):
+        polyline = list(zip(polyline[0::2], polyline[1::2]))
+    return {
+        "distance_km": entry["distance_km"],
+        "duration_minutes": entry["duration_minutes"],
+        "polyline_points": polyline,
+    }
+
+
+def get_route(start_coords, end_coords, vehicle_type, via_coords=None, deadline=None):
     """Get route polyline, distance, and time using Google Directions API."""
+    mode = map_vehicle_to_mode(vehicle_type)
+    key = route_cache_key(start_coords, end_coords, mode, via_coords)
+    cached = route_cache_lookup(key)
+    if cached is not None:
+        return cached
+
+    # Concurrent misses for the same route key share one upstream call
+    try:
+        return route_flight.do_within(deadline, key, _route_upstream, key, start_coords, end_coords, mode,
+                                      via_coords)
+    except UpstreamUnavailable:
+        stale = stale_route(key)
+        if stale is None:
+            raise
+        return stale
+
+
+def route_cache_lookup(key) -> Optional[Dict[str, Any]]:
+    """The cached get_route result for a route_cache_key, or None."""
+    cached = route_cache.get(key)
+    return _route_result(cached) if cached is not None else None
+
+
+def stale_route(key) -> Optional[Dict[str, Any]]:
+    """An expired route_cache answer, for use while the Directions API is unavailable."""
+    stale = route_cache.get_stale(key)
+    if stale is None:
+        return None
+    STALE_SERVED.inc(cache="route")
+    return _route_result(stale)
+
+
+def _route_upstream(key, start_coords, end_coords, mode, via_coords, deadline=None):
+    """Call the Directions API, decode the polyline and record it in route_cache."""
+    url, params = route_request(start_coords, end_coords, mode, via_coords)
+    resp = http_get(url, params, api="directions", deadline=deadline)
+    return route_answer(key, resp.status_code, resp.json() if resp.status_code == 200 else None)
+
+
+def route_request(start_coords, end_coords, mode, via_coords=None) -> Tuple[str, Dict[str, Any]]:
+    """URL and query parameters of a Directions API call."""
     if not GOOGLE_API_KEY:
         raise RuntimeError("GOOGLE_MAPS_API_KEY is not configured")
 
-    url = "https://maps.googleapis.com/maps/api/directions/json"
+    url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/directions/json"
     origin = f"{start_coords[0]},{start_coords[1]}"
     destination = f"{end_coords[0]},{end_coords[1]}"
 
     params = {
         "origin": origin,
         "destination": destination,
-        "mode": map_vehicle_to_mode(vehicle_type),
+        "mode": mode,
         "key": GOOGLE_API_KEY,
     }
 
     if via_coords:
         params["waypoints"] = "|".join([f"via:{lat},{lng}" for lat, lng in via_coords])
+    return url, params
 
-    resp = requests.get(url, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Directions request failed: {resp.status_code}")
 
-    data = resp.json()
+def route_answer(key, status_code: int, data) -> Dict[str, Any]:
+    """Turn a Directions API response into get_route's result, recording it in route_cache."""
+    if status_code != 200:
+        raise RuntimeError(f"Directions request failed: {status_code}")
+
     if data.get("status") != "OK":
         raise RuntimeError("No route found by Directions API")
 
@@ -177,114 +1411,1266 @@ def get_route(start_coords, end_coords, vehicle_type, via_coords=None):
     duration_minutes = leg["duration"]["value"] / 60
 
     polyline = data["routes"][0]["overview_polyline"]["points"]
+
+    # Cached as a read-only (N, 2) NumPy array, or a flat lat,lng,lat,lng... array('d')
+    # without NumPy, so hits skip decode_polyline
+    with timed_stage("polyline_decode"):
+        if np is not None:
+            points = decode_polyline_array(polyline)
+            points.flags.writeable = False
+            compact = points
+        else:
+            points = decode_polyline(polyline)
+            compact = array("d", (c for point in points for c in point))
+
+    route_cache.set(key, {
+        "distance_km": distance_km,
+        "duration_minutes": duration_minutes,
+        "polyline": compact,
+    })
     return {
         "distance_km": distance_km,
         "duration_minutes": duration_minutes,
-        "polyline_points": decode_polyline(polyline),
+        "polyline_points": points,
     }
 
 
 def sample_route_points(polyline_points, step=10):
     """Pick every Nth point to reduce API load."""
-    return polyline_points[::step] if polyline_points else []
+    if polyline_points is None or len(polyline_points) == 0:
+        return []
+    return polyline_points[::step]
 
 
-def find_places_along_route(points, category, radius_meters):
-    """Call Google Places Nearby Search API for each point."""
-    if category not in CATEGORY_MAPPING:
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Great-circle distance between two (lat, lng) points in km."""
+    lat1, lng1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lng2 = math.radians(b[0]), math.radians(b[1])
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def sampling_spacing_km(radius_km: float, overlap: float = ROUTE_SAMPLING_OVERLAP) -> float:
+    """
+    Distance between query centres for a search radius. Neighbouring circles
+    overlap by `overlap` of their diameter (0 = circles just touch).
+    """
+    overlap = min(max(overlap, 0.0), 0.9)
+    return 2 * radius_km * (1 - overlap)
+
+
+def resample_route_by_distance(polyline_points, spacing_km: float) -> List[Tuple[float, float]]:
+    """
+    Query centres every `spacing_km` (great-circle) along the route, plus the destination
+    when it is over half a spacing past the last one.
+    """
+    if polyline_points is None or len(polyline_points) == 0:
         return []
+    if spacing_km <= 0:
+        return [tuple(p) for p in _as_point_list(polyline_points)]
+    if np is not None and isinstance(polyline_points, np.ndarray):
+        return _resample_array(polyline_points, spacing_km)
+
+    samples = [tuple(polyline_points[0])]
+    travelled = 0.0          # distance from route start to the current vertex
+    next_at = spacing_km     # distance from route start of the next centre
+
+    for a, b in zip(polyline_points, polyline_points[1:]):
+        seg = haversine_km(a, b)
+        while seg > 0 and travelled + seg >= next_at:
+            f = (next_at - travelled) / seg
+            samples.append((round(a[0] + (b[0] - a[0]) * f, 6),
+                            round(a[1] + (b[1] - a[1]) * f, 6)))
+            next_at += spacing_km
+        travelled += seg
+
+    if travelled - (next_at - spacing_km) > spacing_km / 2:
+        samples.append(tuple(polyline_points[-1]))
+    return samples
+
+
+def _resample_array(points, spacing_km: float) -> List[Tuple[float, float]]:
+    """Vectorised resample_route_by_distance for an (N, 2) NumPy array."""
+    rad = np.radians(points)
+    dlat = np.diff(rad[:, 0])
+    dlng = np.diff(rad[:, 1])
+    h = np.sin(dlat / 2) ** 2 + np.cos(rad[:-1, 0]) * np.cos(rad[1:, 0]) * np.sin(dlng / 2) ** 2
+    seg = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+    travelled = np.concatenate(([0.0], np.cumsum(seg)))
+    total = travelled[-1]
+
+    targets = np.arange(spacing_km, total + 1e-9, spacing_km)
+    idx = np.clip(np.searchsorted(travelled, targets, side="right") - 1, 0, len(seg) - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = np.where(seg[idx] > 0, (targets - travelled[idx]) / seg[idx], 0.0)
+    inner = np.round(points[idx] + (points[idx + 1] - points[idx]) * f[:, None], 6)
+
+    samples = [tuple(points[0].tolist())] + [tuple(p) for p in inner.tolist()]
+    last_at = targets[-1] if len(targets) else 0.0
+    if total - last_at > spacing_km / 2:
+        samples.append(tuple(points[-1].tolist()))
+    return samples
+
+
+def _as_point_list(points) -> List[Tuple[float, float]]:
+    """Plain list of (lat, lng) float tuples from a list or an (N, 2) array."""
+    if np is not None and isinstance(points, np.ndarray):
+        return [tuple(p) for p in points.tolist()]
+    return list(points)
+
+
+def sample_route(polyline_points, radius_km, mode=None, step=None, overlap=None):
+    """
+    Choose query centres for a route and report how many Nearby Search calls
+    per category the chosen mode saves compared with every-Nth-vertex sampling.
+    """
+    mode = mode or ROUTE_SAMPLING_MODE
+    step = step or ROUTE_SAMPLING_STEP
+    overlap = ROUTE_SAMPLING_OVERLAP if overlap is None else overlap
+
+    step_points = sample_route_points(polyline_points, step)
+    if mode == "step":
+        points = _as_point_list(step_points)
+        spacing_km = None
+    else:
+        spacing_km = sampling_spacing_km(radius_km, overlap)
+        points = resample_route_by_distance(polyline_points, spacing_km)
+
+    stats = {
+        "mode": "step" if mode == "step" else "distance",
+        "spacing_km": round(spacing_km, 3) if spacing_km else None,
+        "step_sample_count": len(step_points),
+        "sample_count": len(points),
+        "calls_saved_per_category": len(step_points) - len(points),
+    }
+    return points, stats
+
+
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS_KM
+
+
+class RouteIndex:
+    """Uniform km grid over a route's segments, so locate() only looks at the route near a point."""
+
+    def __init__(self, polyline_points, cell_km: float):
+        self.cell_km = cell_km
+        if np is not None:
+            pts = np.asarray(polyline_points, dtype=np.float64).reshape(-1, 2)
+            lat0 = float(pts[:, 0].mean()) if len(pts) else 0.0
+            self.kx = KM_PER_DEGREE * math.cos(math.radians(lat0))
+            self.x, self.y = pts[:, 1] * self.kx, pts[:, 0] * KM_PER_DEGREE
+            rad = np.radians(pts)
+            h = (np.sin(np.diff(rad[:, 0]) / 2) ** 2
+                 + np.cos(rad[:-1, 0]) * np.cos(rad[1:, 0]) * np.sin(np.diff(rad[:, 1]) / 2) ** 2)
+            self.seg_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+            self.along = np.concatenate(([0.0], np.cumsum(self.seg_km)))
+            self.points = pts
+            grid = self._grid_array(cell_km) if len(pts) > 1 else {}
+        else:
+            pts = _as_point_list(polyline_points)
+            lat0 = sum(p[0] for p in pts) / len(pts) if pts else 0.0
+            self.kx = KM_PER_DEGREE * math.cos(math.radians(lat0))
+            self.x = xs = [p[1] * self.kx for p in pts]
+            self.y = ys = [p[0] * KM_PER_DEGREE for p in pts]
+            self.seg_km = [haversine_km(a, b) for a, b in zip(pts, pts[1:])]
+            self.along = [0.0]
+            for seg in self.seg_km:
+                self.along.append(self.along[-1] + seg)
+            self.points = pts
+            grid = {}
+            for i in range(len(xs) - 1):
+                for cell in _bbox_cells(xs[i], ys[i], xs[i + 1], ys[i + 1], cell_km):
+                    grid.setdefault(cell, []).append(i)
+
+        self.grid = grid
+        self.bounds = (min(c[0] for c in grid), max(c[0] for c in grid),
+                       min(c[1] for c in grid), max(c[1] for c in grid)) if grid else None
+
+    def _grid_array(self, cell_km: float) -> Dict[Tuple[int, int], Any]:
+        """The segment grid built with NumPy: cell -> array of segment indexes."""
+        x, y = self.x, self.y
+        cx0 = np.floor(np.minimum(x[:-1], x[1:]) / cell_km).astype(np.int64)
+        cx1 = np.floor(np.maximum(x[:-1], x[1:]) / cell_km).astype(np.int64)
+        cy0 = np.floor(np.minimum(y[:-1], y[1:]) / cell_km).astype(np.int64)
+        cy1 = np.floor(np.maximum(y[:-1], y[1:]) / cell_km).astype(np.int64)
+
+        # Most segments sit inside one cell: group those in bulk
+        single = (cx0 == cx1) & (cy0 == cy1)
+        segs = np.flatnonzero(single)
+        grid = {}
+        if len(segs):
+            segs = segs[np.lexsort((segs, cy0[segs], cx0[segs]))]
+            keys = np.column_stack((cx0[segs], cy0[segs]))
+            starts = np.flatnonzero(np.concatenate(([True], np.any(keys[1:] != keys[:-1], axis=1))))
+            grid = {(int(keys[k, 0]), int(keys[k, 1])): group
+                    for k, group in zip(starts, np.split(segs, starts[1:]))}
+
+        for i in np.flatnonzero(~single).tolist():
+            for cell in _bbox_cells(x[i], y[i], x[i + 1], y[i + 1], cell_km):
+                group = grid.get(cell)
+                grid[cell] = np.array([i], dtype=np.intp) if group is None else np.append(group, i)
+        return grid
+
+    @property
+    def length_km(self) -> float:
+        return float(self.along[-1]) if len(self.along) else 0.0
+
+    def locate(self, lat: float, lng: float) -> Optional[Tuple[float, float]]:
+        """(km along the route, km off the route) for a point; None for a route without points."""
+        if len(self.points) == 0:
+            return None
+        if self.bounds is None:
+            return 0.0, haversine_km((lat, lng), tuple(self.points[0]))
+
+        qx, qy = lng * self.kx, lat * KM_PER_DEGREE
+        c = self.cell_km
+        ccx, ccy = math.floor(qx / c), math.floor(qy / c)
+        min_cx, max_cx, min_cy, max_cy = self.bounds
+        first_ring = max(0, min_cx - ccx, ccx - max_cx, min_cy - ccy, ccy - max_cy)
+        last_ring = max(ccx - min_cx, max_cx - ccx, ccy - min_cy, max_cy - ccy)
+
+        best_d2, best_seg, best_t = math.inf, -1, 0.0
+        for r in range(first_ring, last_ring + 1):
+            candidates = []
+            for cx, cy in _grid_ring(ccx, ccy, r):
+                segs = self.grid.get((cx, cy))
+                if segs is None:
+                    continue
+                dx = max(cx * c - qx, 0.0, qx - (cx + 1) * c)
+                dy = max(cy * c - qy, 0.0, qy - (cy + 1) * c)
+                if dx * dx + dy * dy <= best_d2:
+                    candidates.append(segs)
+            if candidates:
+                d2, seg, t = self._nearest(candidates, qx, qy)
+                if d2 < best_d2 or (d2 == best_d2 and seg < best_seg):
+                    best_d2, best_seg, best_t = d2, seg, t
+            # Every cell beyond ring r is at least r cells away
+            if best_d2 <= (r * c) ** 2:
+                break
+
+        (lat0, lng0), (lat1, lng1) = self.points[best_seg], self.points[best_seg + 1]
+        foot = (lat0 + (lat1 - lat0) * best_t, lng0 + (lng1 - lng0) * best_t)
+        along = self.along[best_seg] + self.seg_km[best_seg] * best_t
+        return float(along), haversine_km((lat, lng), (float(foot[0]), float(foot[1])))
+
+    def _nearest(self, candidates, qx, qy) -> Tuple[float, int, float]:
+        """(squared planar distance, segment, position along it 0..1) of the closest candidate segment."""
+        x, y = self.x, self.y
+        if np is not None:
+            segs = np.concatenate(candidates) if len(candidates) > 1 else candidates[0]
+            ax, ay = x[segs], y[segs]
+            dx, dy = x[segs + 1] - ax, y[segs + 1] - ay
+            length2 = dx * dx + dy * dy
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.where(length2 > 0, ((qx - ax) * dx + (qy - ay) * dy) / length2, 0.0)
+            t = np.clip(t, 0.0, 1.0)
+            d2 = (ax + t * dx - qx) ** 2 + (ay + t * dy - qy) ** 2
+            # Lowest segment among equals, so a route passing twice resolves to the first pass
+            order = np.lexsort((segs, d2))
+            k = order[0]
+            return float(d2[k]), int(segs[k]), float(t[k])
+
+        best = (math.inf, -1, 0.0)
+        for segs in candidates:
+            for i in segs:
+                ax, ay = x[i], y[i]
+                dx, dy = x[i + 1] - ax, y[i + 1] - ay
+                length2 = dx * dx + dy * dy
+                t = min(1.0, max(0.0, ((qx - ax) * dx + (qy - ay) * dy) / length2)) if length2 > 0 else 0.0
+                d2 = (ax + t * dx - qx) ** 2 + (ay + t * dy - qy) ** 2
+                if d2 < best[0] or (d2 == best[0] and i < best[1]):
+                    best = (d2, i, t)
+        return best
+
+
+def _bbox_cells(x0: float, y0: float, x1: float, y1: float, cell_km: float):
+    """Grid cells touched by the bounding box of a segment."""
+    for cx in range(math.floor(min(x0, x1) / cell_km), math.floor(max(x0, x1) / cell_km) + 1):
+        for cy in range(math.floor(min(y0, y1) / cell_km), math.floor(max(y0, y1) / cell_km) + 1):
+            yield cx, cy
+
+
+def _grid_ring(cx: int, cy: int, r: int):
+    """Cells at Chebyshev distance exactly r from (cx, cy)."""
+    if r == 0:
+        yield cx, cy
+        return
+    for x in range(cx - r, cx + r + 1):
+        yield x, cy - r
+        yield x, cy + r
+    for y in range(cy - r + 1, cy + r):
+        yield cx - r, y
+        yield cx + r, y
+
+
+def route_index_cell_km(radius_km: float) -> float:
+    """Grid cell size for a trip's RouteIndex: ROUTE_INDEX_CELL_KM, or a quarter of the search radius."""
+    return ROUTE_INDEX_CELL_KM if ROUTE_INDEX_CELL_KM > 0 else max(0.5, radius_km / 4)
+
+
+STOP_ORDERS = ("route", "detour", "rating", "search")
+
+
+def arrange_stops(stops: List["PlaceRecord"], route_index: RouteIndex, params: Dict[str, Any]):
+    """
+    Add route distances to stops, apply the trip's detour, along-route and per-category
+    limits, and order them by stops_order.
+    """
+    max_detour = params.get("max_detour_km")
+    window_from = params.get("min_along_route_km")
+    window_to = params.get("max_along_route_km")
+    filtered = max_detour is not None or window_from is not None or window_to is not None
+
+    kept = []
+    for stop in stops:
+        located = None
+        if stop.lat is not None and stop.lon is not None:
+            located = route_index.locate(stop.lat, stop.lon)
+        if located is None:
+            stop.distance_along_route_km = stop.detour_km = None
+            if not filtered:
+                kept.append(stop)
+            continue
+        along, detour = located
+        stop.distance_along_route_km = round(along, 2)
+        stop.detour_km = round(detour, 2)
+        if max_detour is not None and detour > max_detour:
+            continue
+        if window_from is not None and along < window_from:
+            continue
+        if window_to is not None and along > window_to:
+            continue
+        kept.append(stop)
+
+    limit = params.get("max_stops_per_category")
+    if limit and len(kept) > limit:
+        best = {id(stop) for stop in top_stops(kept, limit)}
+        kept = [stop for stop in kept if id(stop) in best]
+
+    order = params.get("stops_order") or "route"
+    if order == "route":
+        kept.sort(key=lambda s: _sort_value(s.distance_along_route_km))
+    elif order == "detour":
+        kept.sort(key=lambda s: (_sort_value(s.detour_km), _sort_value(s.distance_along_route_km)))
+    elif order == "rating":
+        kept.sort(key=lambda s: (-(s.rating or 0), -(s.user_ratings_total or 0)))
+    return kept
+
+
+def stop_score(place: "PlaceRecord") -> float:
+    """Rating shrunk towards RANK_PRIOR_RATING when reviews are few, minus RANK_DETOUR_PENALTY per km."""
+    reviews = place.user_ratings_total or 0
+    rating = place.rating or 0.0
+    score = (reviews * rating + RANK_PRIOR_REVIEWS * RANK_PRIOR_RATING) / (reviews + RANK_PRIOR_REVIEWS or 1)
+    return score - RANK_DETOUR_PENALTY * (place.detour_km or 0.0)
 
+
+def top_stops(stops, k: int) -> List["PlaceRecord"]:
+    """The k best stops by stop_score, best first, from a size-k heap (ties keep input order)."""
+    return heapq.nlargest(k, stops, key=stop_score)
+
+
+def is_strong_candidate(place: "PlaceRecord") -> bool:
+    """Whether a place is good enough to count towards the sweep's early cut-off."""
+    return ((place.rating or 0) >= RANK_CUTOFF_RATING
+            and (place.user_ratings_total or 0) >= RANK_CUTOFF_REVIEWS)
+
+
+def _sort_value(value) -> float:
+    """Sort key that puts missing values last."""
+    return math.inf if value is None else value
+
+
+def _category_query(category: str) -> Tuple[str, Optional[str]]:
+    """Return the (type, keyword) Nearby Search parameters for a preference."""
     mapping = CATEGORY_MAPPING[category]
-    place_type = mapping["type"]
     keyword_str = " ".join(mapping["keywords"]) if mapping["keywords"] else None
+    return mapping["type"], keyword_str
 
-    results = {}
 
-    for lat, lng in points:
-        url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-        params = {
-            "location": f"{lat},{lng}",
-            "radius": radius_meters,
-            "type": place_type,
-            "key": GOOGLE_API_KEY,
+def nearby_search(lat, lng, place_type, keyword, radius_meters, deadline=None) -> Dict[str, Any]:
+    """Run one Nearby Search call; failed calls come back with status 429, 503 or 504 instead of raising."""
+    url, params = nearby_request(lat, lng, place_type, keyword, radius_meters)
+    started = time.perf_counter()
+    resp = None
+    try:
+        resp = http_get(url, params, api="places", deadline=deadline)
+        status = resp.status_code
+    except UpstreamRateLimited:
+        status = 429
+    except UpstreamUnavailable:
+        status = 503
+    except (DeadlineExceeded, requests.RequestException):
+        status = 504
+    latency_ms = (time.perf_counter() - started) * 1000
+    return nearby_call(lat, lng, place_type, keyword, status, resp.json() if status == 200 else {}, latency_ms)
+
+
+def nearby_request(lat, lng, place_type, keyword, radius_meters) -> Tuple[str, Dict[str, Any]]:
+    """URL and query parameters of a Nearby Search call."""
+    url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/place/nearbysearch/json"
+    params = {
+        "location": f"{lat},{lng}",
+        "radius": radius_meters,
+        "type": place_type,
+        "key": GOOGLE_API_KEY,
+    }
+    if keyword:
+        params["keyword"] = keyword
+    return url, params
+
+
+def nearby_call(lat, lng, place_type, keyword, status, data, latency_ms: float) -> Dict[str, Any]:
+    """The per-call record nearby_search returns: query, HTTP and API status, timing and results."""
+    return {
+        "lat": lat,
+        "lng": lng,
+        "type": place_type,
+        "keyword": keyword,
+        "status": status,
+        "api_status": data.get("status"),
+        "latency_ms": round(latency_ms, 1),
+        "results": [PlaceRecord.from_result(p) for p in data.get("results", []) if p.get("place_id")],
+    }
+
+
+def snap_to_cell(lat, lng, radius_meters) -> Tuple[str, Tuple[float, float]]:
+    """Return the geohash cell of a query centre and the cell's centre point."""
+    cell = geohash_encode(lat, lng, places_geohash_precision(radius_meters))
+    return cell, geohash_center(cell)
+
+
+def cached_nearby_search(lat, lng, place_type, keyword, radius_meters, deadline=None) -> Dict[str, Any]:
+    """
+    Nearby Search through places_cache. The query centre is snapped to its
+    geohash cell centre so routes sharing a corridor share upstream calls.
+    """
+    key, (clat, clng), hit = places_cache_lookup(lat, lng, place_type, keyword, radius_meters)
+    if hit is not None:
+        return hit
+
+    # Concurrent misses for the same cell and query share one upstream call
+    started = time.perf_counter()
+    try:
+        shared, coalesced = places_flight.join_within(deadline, key, _nearby_upstream, key, clat, clng,
+                                                      place_type, keyword, radius_meters)
+        call = dict(shared)
+    except DeadlineExceeded:
+        # This trip's deadline passed while the shared call carries on: report a timed-out call
+        call = nearby_call(clat, clng, place_type, keyword, 504, {}, (time.perf_counter() - started) * 1000)
+        coalesced = False
+    call["cached"] = False
+    call["coalesced"] = coalesced
+    return call
+
+
+def places_cache_lookup(lat, lng, place_type, keyword, radius_meters):
+    """
+    Snap a query to its cache cell and look it up. Returns (key, cell centre,
+    call) where call is the cached answer, shaped like nearby_search's, or None.
+    """
+    cell, (clat, clng) = snap_to_cell(lat, lng, radius_meters)
+    key = (cell, place_type, keyword, radius_meters)
+    results = places_cache.get(key)
+    if results is None:
+        return key, (clat, clng), None
+    return key, (clat, clng), {
+        "lat": clat,
+        "lng": clng,
+        "type": place_type,
+        "keyword": keyword,
+        "status": 200,
+        "api_status": "OK",
+        "latency_ms": 0.0,
+        "cached": True,
+        "coalesced": False,
+        "results": results,
+    }
+
+
+def _nearby_upstream(key, lat, lng, place_type, keyword, radius_meters, deadline=None) -> Dict[str, Any]:
+    """Run nearby_search and record its answer with store_nearby_answer."""
+    return store_nearby_answer(key, nearby_search(lat, lng, place_type, keyword, radius_meters, deadline))
+
+
+def store_nearby_answer(key, call: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Record a usable Nearby Search answer in places_cache. A failed call is
+    answered from an expired cache entry when there is one.
+    """
+    if call["status"] == 200 and call["api_status"] in ("OK", "ZERO_RESULTS"):
+        places_cache.set(key, tuple(call["results"]))
+        return call
+
+    stale = places_cache.get_stale(key)
+    if stale is not None:
+        STALE_SERVED.inc(cache="places")
+        call.update({"status": 200, "api_status": "OK", "stale": True, "results": stale})
+    return call
+
+
+# Shared instances of each distinct "types" tuple seen in Nearby Search results
+_PLACE_TYPES: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+class PlaceRecord:
+    """
+    A Nearby Search result as a slotted object; to_json() gives the response's stop dict.
+    Cached records are shared between trips, so trips annotate copies.
+    """
+
+    __slots__ = ("place_id", "name", "lat", "lon", "address", "rating", "user_ratings_total",
+                 "types", "opening_hours", "distance_along_route_km", "detour_km", "ai_details")
+
+    def __init__(self, place_id: str, name: Optional[str] = None, lat: Optional[float] = None,
+                 lon: Optional[float] = None, address: Optional[str] = None, rating: Optional[float] = None,
+                 user_ratings_total: Optional[int] = None, types: Tuple[str, ...] = (),
+                 opening_hours: Optional[Dict[str, Any]] = None):
+        self.place_id = place_id
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.address = address
+        self.rating = rating
+        self.user_ratings_total = user_ratings_total
+        self.types = types
+        self.opening_hours = opening_hours
+        self.distance_along_route_km = None
+        self.detour_km = None
+        self.ai_details = None
+
+    @classmethod
+    def from_result(cls, place: Dict[str, Any]) -> "PlaceRecord":
+        """Build a record from a raw Nearby Search result (which must have a place_id)."""
+        loc = (place.get("geometry") or {}).get("location") or {}
+        types = tuple(sys.intern(t) for t in place.get("types") or ())
+        return cls(
+            place["place_id"],
+            place.get("name"),
+            loc.get("lat"),
+            loc.get("lng"),
+            place.get("vicinity"),
+            place.get("rating"),
+            place.get("user_ratings_total"),
+            _PLACE_TYPES.setdefault(types, types),
+            place.get("opening_hours") or None,
+        )
+
+    def copy(self) -> "PlaceRecord":
+        other = PlaceRecord.__new__(PlaceRecord)
+        for slot in PlaceRecord.__slots__:
+            setattr(other, slot, getattr(self, slot))
+        return other
+
+    @property
+    def maps_url(self) -> str:
+        return build_maps_url(self.place_id)
+
+    def to_json(self, fields=None) -> Dict[str, Any]:
+        """The stop as it appears in /plan-trip responses and events, optionally only `fields`."""
+        entry = {
+            "name": self.name,
+            "lat": self.lat,
+            "lon": self.lon,
+            "address": self.address,
+            "rating": self.rating,
+            "user_ratings_total": self.user_ratings_total,
+            "place_id": self.place_id,
+            "maps_url": self.maps_url,
         }
-        if keyword_str:
-            params["keyword"] = keyword_str
+        if self.opening_hours:
+            entry["opening_hours"] = self.opening_hours
+        entry["distance_along_route_km"] = self.distance_along_route_km
+        entry["detour_km"] = self.detour_km
+        if self.ai_details is not None:
+            entry["ai_details"] = self.ai_details
+        if fields is not None:
+            return {k: entry[k] for k in fields if k in entry}
+        return entry
 
-        resp = requests.get(url, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
-        if resp.status_code != 200:
-            continue
 
-        for place in resp.json().get("results", []):
-            pid = place.get("place_id")
-            if not pid or pid in results:
-                continue
+STOP_FIELDS = ("name", "lat", "lon", "address", "rating", "user_ratings_total", "place_id", "maps_url",
+               "opening_hours", "distance_along_route_km", "detour_km", "ai_details")
 
-            loc = place["geometry"]["location"]
-            entry = {
-                "name": place.get("name"),
-                "lat": loc.get("lat"),
-                "lon": loc.get("lng"),
-                "address": place.get("vicinity"),
-                "rating": place.get("rating"),
-                "user_ratings_total": place.get("user_ratings_total"),
-                "place_id": pid,
-                "maps_url": build_maps_url(pid),
-            }
-            if place.get("opening_hours"):
-                entry["opening_hours"] = place["opening_hours"]
 
-            results[pid] = entry
+class PlannerJSONProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider, serialising PlaceRecord stops with to_json() and
+    encoding with orjson when it is installed (and FAST_JSON is on).
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, PlaceRecord):
+            return o.to_json()
+        return DefaultJSONProvider.default(o)
+
+    def _orjson_options(self) -> int:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        return options | orjson.OPT_SORT_KEYS if self.sort_keys else options
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or not FAST_JSON or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode()
 
+    def response(self, *args, **kwargs):
+        # Debug mode keeps the stdlib encoder's pretty-printing
+        if orjson is None or not FAST_JSON or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+app.json = PlannerJSONProvider(app)
+
+
+def _merge_places(calls, keep=None) -> List[PlaceRecord]:
+    """Copies of the calls' results in order, first of each place_id, filtered by `keep` if given."""
+    results = {}
+    for call in calls:
+        for place in call["results"]:
+            if place.place_id in results:
+                continue
+            if keep is not None and not keep(place):
+                continue
+            results[place.place_id] = place.copy()
     return list(results.values())
 
 
-# --------- ChatGPT integration --------- #
+def _keyword_matcher(keywords: List[str]):
+    """Client-side stand-in for the Nearby Search keyword filter: any keyword in name or types."""
+    words = [k.casefold() for k in keywords]
 
-def generate_place_details_with_ai(place, category):
-    """Use OpenAI API to generate helpful descriptions."""
-    if not openai_enabled:
-        return None
+    def keep(place: PlaceRecord) -> bool:
+        text = " ".join([place.name or "", *place.types]).casefold()
+        return any(w in text for w in words)
+
+    return keep
+
+
+def plan_places_queries(categories: List[str]) -> List[Dict[str, Any]]:
+    """
+    Group preferences into Nearby Search queries: identical (type, keyword) queries are shared,
+    and keyword categories also take client-side matches from their type's unfiltered query.
+    """
+    if not PLANNER_SHARED_QUERIES:
+        return [{"type": _category_query(c)[0], "keyword": _category_query(c)[1],
+                 "categories": [c], "keyword_categories": []} for c in categories]
+
+    by_query: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+    for category in categories:
+        place_type, keyword = _category_query(category)
+        query = by_query.setdefault((place_type, keyword), {"type": place_type, "keyword": keyword,
+                                                            "categories": [], "keyword_categories": []})
+        query["categories"].append(category)
+    for (place_type, keyword), query in by_query.items():
+        unfiltered = by_query.get((place_type, None))
+        if keyword is not None and unfiltered is not None:
+            unfiltered["keyword_categories"].extend(query["categories"])
+    return list(by_query.values())
+
+
+def _iter_bounded(fn, items, concurrency, deadline=None):
+    """Run fn(*item) on the Places pool, `concurrency` at a time, yielding (index, result) as they finish."""
+    if concurrency <= 1 or len(items) <= 1:
+        for i, item in enumerate(items):
+            if deadline is not None and deadline.expired:
+                return
+            yield i, fn(*item)
+        return
+
+    pending = {}
+    next_index = 0
+    try:
+        while next_index < len(items) or pending:
+            while next_index < len(items) and len(pending) < concurrency:
+                future = _places_executor.submit(fn, *items[next_index])
+                pending[future] = next_index
+                next_index += 1
+
+            done, _ = wait(pending, timeout=deadline.remaining() if deadline else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                return
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _run_bounded(fn, items, concurrency):
+    """_iter_bounded collected into a list in input order."""
+    results = [None] * len(items)
+    for i, result in _iter_bounded(fn, items, concurrency):
+        results[i] = result
+    return results
+
+
+def _iter_sweep(queries, centres, radius_meters, concurrency, call_log, deadline=None, enough=None):
+    """
+    Run every (query, centre) search in one fan-out, yielding (query, calls) once a query's calls
+    are back or `enough` says it can stop.
+    """
+    n = len(centres)
+    if n == 0:
+        for query in queries:
+            yield query, []
+        return
+
+    finished = [False] * len(queries)
+
+    def search(q, lat, lng):
+        if finished[q]:
+            return None
+        query = queries[q]
+        return cached_nearby_search(lat, lng, query["type"], query["keyword"], radius_meters, deadline)
+
+    tasks = [(q, lat, lng) for q in range(len(queries)) for lat, lng in centres]
+    calls = [None] * len(tasks)
+    remaining = [n] * len(queries)
+
+    for i, call in _iter_bounded(search, tasks, concurrency, deadline):
+        if call is None:
+            continue
+        calls[i] = call
+        if call_log is not None:
+            call_log.append({k: v for k, v in call.items() if k != "results"})
+        q = i // n
+        if finished[q]:
+            continue
+        remaining[q] -= 1
+        if remaining[q] == 0 or (enough is not None and enough(queries[q], call)):
+            finished[q] = True
+            yield queries[q], [c for c in calls[q * n:(q + 1) * n] if c is not None]
 
-    prompt = f"""
+
+def thin_points(points, limit: int):
+    """Keep `limit` points spread evenly over the list (first and last included)."""
+    if len(points) <= limit:
+        return list(points)
+    if limit <= 1:
+        return [points[len(points) // 2]] if limit == 1 else []
+    return [points[round(i * (len(points) - 1) / (limit - 1))] for i in range(limit)]
+
+
+def spread_order(items) -> list:
+    """
+    Items reordered so that every prefix covers the list evenly: both ends,
+    then the middle, then the quarter points, and so on.
+    """
+    n = len(items)
+    if n <= 2:
+        return list(items)
+    order = [0, n - 1]
+    spans = deque([(0, n - 1)])
+    while spans:
+        lo, hi = spans.popleft()
+        if hi - lo >= 2:
+            mid = (lo + hi) // 2
+            order.append(mid)
+            spans.extend([(lo, mid), (mid, hi)])
+    return [items[i] for i in order]
+
+
+class PlacesSweep:
+    """One trip's Places plan: query centres thinned to `max_calls`, the planned queries and their stops."""
+
+    def __init__(self, points, categories, radius_meters, max_calls=None, cutoff=None):
+        self.radius_meters = radius_meters
+        self.max_calls = max_calls
+        self.cutoff = cutoff
+        self.categories = [c for c in dict.fromkeys(categories) if c in CATEGORY_MAPPING]
+
+        # Points falling in the same cache cell would repeat the exact same query
+        self.centres = list({snap_to_cell(lat, lng, radius_meters)[0]: (lat, lng)
+                             for lat, lng in points}.values())
+        self.sample_points = len(self.centres)
+
+        self.queries = plan_places_queries(self.categories)
+        self.budget_limited = False
+        if max_calls is not None and self.queries and len(self.queries) * len(self.centres) > max_calls:
+            self.centres = thin_points(self.centres, max(1, max_calls // len(self.queries)))
+            self.budget_limited = True
+        if cutoff:
+            self.centres = spread_order(self.centres)
+
+        self.sharing = {c for query in self.queries for c in query["keyword_categories"]}
+        self.own: Dict[str, List[PlaceRecord]] = {}
+        self.matches: Dict[str, List[PlaceRecord]] = {}
+        self.strong: Dict[str, set] = {c: set() for c in self.categories}
+        self.cut_off: List[str] = []
+
+    def enough(self, query, call) -> bool:
+        """
+        Record a finished call's strong candidates (keyword matches only, for
+        keyword_categories). True once every category of the query has `cutoff`.
+        """
+        for category in query["categories"]:
+            self.strong[category].update(p.place_id for p in call["results"] if is_strong_candidate(p))
+        for category in query["keyword_categories"]:
+            keep = _keyword_matcher(CATEGORY_MAPPING[category]["keywords"])
+            self.strong[category].update(p.place_id for p in call["results"]
+                                         if is_strong_candidate(p) and keep(p))
+        if all(len(self.strong[c]) >= self.cutoff for c in query["categories"]):
+            self.cut_off.extend(query["categories"])
+            return True
+        return False
+
+    def resolve(self, query, calls) -> List[Tuple[str, List[PlaceRecord]]]:
+        """(category, stops) for the categories a finished query completes."""
+        for category in query["categories"]:
+            self.own[category] = _merge_places(calls)
+        for category in query["keyword_categories"]:
+            keep = _keyword_matcher(CATEGORY_MAPPING[category]["keywords"])
+            self.matches[category] = _merge_places(calls, keep=keep)
+        return [(c, self._stops(c)) for c in [*query["categories"], *query["keyword_categories"]]
+                if c in self.own and (c in self.matches or c not in self.sharing)]
+
+    def _stops(self, category) -> List[PlaceRecord]:
+        """The category's own results, then client-side matches they do not already include."""
+        stops = self.own[category]
+        seen = {place.place_id for place in stops}
+        return stops + [place for place in self.matches.get(category, []) if place.place_id not in seen]
+
+    def unfinished(self) -> List[Tuple[str, List[PlaceRecord]]]:
+        """(category, stops) for keyword categories whose unfiltered query never finished."""
+        return [(c, self._stops(c)) for c in self.categories
+                if c in self.sharing and c in self.own and c not in self.matches]
+
+    def stats(self) -> Dict[str, Any]:
+        planned = len(self.queries) * len(self.centres)
+        naive = len(self.categories) * self.sample_points
+        return {
+            "queries": len(self.queries),
+            "planned_calls": planned,
+            "naive_calls": naive,
+            "calls_saved": naive - planned,
+            "sample_points": self.sample_points,
+            "searched_points": len(self.centres),
+            "budget_limited": self.budget_limited,
+            "cut_off_categories": self.cut_off,
+        }
+
+
+def iter_places_for_categories(points, categories, radius_meters, concurrency=None,
+                               call_log=None, plan_stats=None, max_calls=None, deadline=None,
+                               cutoff=None):
+    """Run a trip's PlacesSweep in one fan-out, yielding (category, stops) as each category completes."""
+    if concurrency is None:
+        concurrency = PLACES_CONCURRENCY
+
+    sweep = PlacesSweep(points, categories, radius_meters, max_calls, cutoff)
+    enough = sweep.enough if cutoff else None
+    for query, calls in _iter_sweep(sweep.queries, sweep.centres, radius_meters, concurrency,
+                                    call_log, deadline, enough):
+        yield from sweep.resolve(query, calls)
+    yield from sweep.unfinished()
+
+    if plan_stats is not None:
+        plan_stats.update(sweep.stats())
+
+
+def find_places_for_categories(points, categories, radius_meters, concurrency=None,
+                               call_log=None, plan_stats=None):
+    """iter_places_for_categories collected into a dict in category order."""
+    found = dict(iter_places_for_categories(points, categories, radius_meters, concurrency,
+                                            call_log, plan_stats))
+    return {c: found[c] for c in dict.fromkeys(categories) if c in found}
+
+
+def find_places_along_route(points, category, radius_meters):
+    """Call Google Places Nearby Search API for each point."""
+    if category not in CATEGORY_MAPPING:
+        return []
+    return find_places_for_categories(points, [category], radius_meters)[category]
+
+
+# --------- ChatGPT integration --------- #
+
+AI_PROMPT_TEMPLATE = """
 You are a road trip guide. Write a short description for this place.
 
 Category: {category}
-Name: {place.get("name")}
-Address: {place.get("address")}
-Rating: {place.get("rating")}
-Total Reviews: {place.get("user_ratings_total")}
-Google Maps: {place.get("maps_url")}
+Name: {name}
+Address: {address}
+Rating: {rating}
+Total Reviews: {user_ratings_total}
+Google Maps: {maps_url}
 
 Provide:
 - 2 sentence summary
 - 3 bullet reasons to visit
 - Ideal audience (families, couples, etc.)
 """
+
+# Changing the prompt wording invalidates cached descriptions
+AI_PROMPT_HASH = hashlib.sha256(AI_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:16]
+
+
+class AIDetailsCache:
+    """
+    Cache of AI descriptions keyed by place_id, category, OPENAI_MODEL and the
+    prompt template hash: an LRU in front of an optional size-capped SQLite store.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int, memory_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.memory = TTLCache(memory_entries, ttl_seconds)
+        self.disk = SQLiteCache(path, "ai_details", max_entries=max_entries) if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(place_id: str, category: str, model: str = None, prompt_hash: str = None) -> str:
+        return "|".join([place_id, category, model or OPENAI_MODEL, prompt_hash or AI_PROMPT_HASH])
+
+    def get(self, place_id: str, category: str, prompt_hashes: Sequence[str] = ()) -> Optional[str]:
+        """The text cached under the first of `prompt_hashes` (default AI_PROMPT_HASH) that has one."""
+        if not place_id:
+            return None
+        for prompt_hash in prompt_hashes or [AI_PROMPT_HASH]:
+            key = self.key(place_id, category, prompt_hash=prompt_hash)
+            text = self.memory.get(key)
+            if text is not None:
+                self.memory_hits += 1
+                return text
+            if self.disk is not None:
+                found = self.disk.get(key)
+                if found is not None:
+                    text, expires_at = found
+                    self.memory.set(key, text, ttl_seconds=expires_at - time.time())
+                    self.disk_hits += 1
+                    return text
+        self.misses += 1
+        return None
+
+    def set(self, place_id: str, category: str, text: str,
+            model: str = None, prompt_hash: str = None) -> None:
+        if not place_id:
+            return
+        key = self.key(place_id, category, model, prompt_hash)
+        self.memory.set(key, text)
+        if self.disk is not None:
+            self.disk.set(key, text, self.ttl_seconds)
+
+    def warm_up(self, path: str) -> int:
+        """Load [{"place_id", "category", "ai_details"[, "model"]}, ...] from a JSON file."""
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        loaded = 0
+        for entry in entries:
+            if entry.get("place_id") and entry.get("category") and entry.get("ai_details"):
+                self.set(entry["place_id"], entry["category"],
+                         entry["ai_details"], model=entry.get("model"))
+                loaded += 1
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+        }
+
+
+ai_cache = AIDetailsCache(AI_CACHE_PATH, AI_CACHE_TTL_SECONDS, AI_CACHE_MAX_ENTRIES, AI_CACHE_MEMORY_ENTRIES)
+
+if AI_CACHE_WARMUP_FILE:
+    try:
+        print(f"AI cache: loaded {ai_cache.warm_up(AI_CACHE_WARMUP_FILE)} entries from {AI_CACHE_WARMUP_FILE}")
+    except (OSError, ValueError) as e:
+        print("AI cache warm-up failed:", e)
+
+
+class AIUsageStats:
+    """Running call, token and latency totals per enrichment mode."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, mode: str, response, latency_ms: float, places: int) -> None:
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            t = self._totals.setdefault(mode, {"calls": 0, "places": 0, "input_tokens": 0,
+                                               "output_tokens": 0, "latency_ms": 0.0})
+            t["calls"] += 1
+            t["places"] += places
+            t["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+            t["output_tokens"] += getattr(usage, "output_tokens", 0) or 0
+            t["latency_ms"] += latency_ms
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Totals per mode plus per-place averages, for comparing batch with per-place."""
+        with self._lock:
+            out = {}
+            for mode, t in self._totals.items():
+                places = t["places"] or 1
+                out[mode] = dict(t)
+                out[mode]["tokens_per_place"] = round((t["input_tokens"] + t["output_tokens"]) / places, 1)
+                out[mode]["latency_ms_per_place"] = round(t["latency_ms"] / places, 1)
+            return out
+
+
+ai_usage = AIUsageStats()
+
+
+def place_prompt(place, category) -> str:
+    """The per-place description prompt."""
+    return AI_PROMPT_TEMPLATE.format(
+        category=category,
+        name=place.name,
+        address=place.address,
+        rating=place.rating,
+        user_ratings_total=place.user_ratings_total,
+        maps_url=place.maps_url,
+    ).strip()
+
+
+def generate_place_details_with_ai(place, category, use_cache=True, timeout=None):
+    """Use OpenAI API to generate helpful descriptions, served from ai_cache when possible."""
+    if not openai_enabled:
+        return None
+
+    if use_cache:
+        cached = ai_cache.get(place.place_id, category)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
     try:
         response = openai_client.responses.create(
             model=OPENAI_MODEL,
-            input=prompt.strip(),
+            input=place_prompt(place, category),
+            timeout=timeout or AI_CALL_TIMEOUT_SECONDS,
         )
         text = getattr(response, "output_text", None)
-        return text
     except Exception as e:
+        record_upstream("openai", "error", time.perf_counter() - started)
         print("OpenAI Error:", e)
         return None
+    record_upstream("openai", "ok", time.perf_counter() - started)
+    ai_usage.record("per_place", response, (time.perf_counter() - started) * 1000, 1)
 
+    if text:
+        ai_cache.set(place.place_id, category, text)
+    return text
 
-def enrich_stops_with_ai(stops_by_category):
-    """Add AI-generated 'ai_details' to top N places."""
+
+AI_BATCH_PROMPT_TEMPLATE = """
+You are a road trip guide. Write a short description for each place listed below.
+
+For every place provide:
+- 2 sentence summary
+- 3 bullet reasons to visit
+- Ideal audience (families, couples, etc.)
+
+Respond with a single JSON object whose keys are the place_id values below and
+whose values are the description text for that place. Include every place_id.
+
+Places:
+{places_json}
+"""
+
+AI_BATCH_PROMPT_HASH = hashlib.sha256(AI_BATCH_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:16]
+
+
+def generate_batch_details_with_ai(items, timeout=None) -> Optional[Dict[str, str]]:
+    """Describe several (place, category) items in one JSON request; {place_id: text}, or None on failure."""
+    if not openai_enabled or not items:
+        return None
+
+    listed, prompt = batch_prompt(items)
+    started = time.perf_counter()
+    try:
+        response = openai_client.responses.create(
+            model=OPENAI_MODEL,
+            input=prompt,
+            text={"format": {"type": "json_object"}},
+            timeout=timeout or AI_BATCH_TIMEOUT_SECONDS,
+        )
+    except Exception as e:
+        record_upstream("openai", "error", time.perf_counter() - started)
+        print("OpenAI Error:", e)
+        return None
+    record_upstream("openai", "ok", time.perf_counter() - started)
+    ai_usage.record("batch", response, (time.perf_counter() - started) * 1000, len(listed))
+    return parse_batch_output(listed, getattr(response, "output_text", None))
+
+
+def batch_prompt(items) -> Tuple[Dict[str, Dict[str, Any]], str]:
+    """The batch prompt for (place, category) items, and the places it lists by place_id."""
+    listed = {}
+    for place, category in items:
+        pid = place.place_id
+        if pid and pid not in listed:
+            listed[pid] = {
+                "place_id": pid,
+                "category": category,
+                "name": place.name,
+                "address": place.address,
+                "rating": place.rating,
+                "user_ratings_total": place.user_ratings_total,
+            }
+    prompt = AI_BATCH_PROMPT_TEMPLATE.format(
+        places_json=json.dumps(list(listed.values()), ensure_ascii=False, indent=1)
+    )
+    return listed, prompt.strip()
+
+
+def parse_batch_output(listed, output_text: Optional[str]) -> Optional[Dict[str, str]]:
+    """{place_id: text} from a batch reply, or None when it is not a JSON object."""
+    try:
+        data = json.loads(output_text or "")
+    except ValueError:
+        app.logger.warning("OpenAI batch response is not valid JSON")
+        return None
+    if not isinstance(data, dict):
+        app.logger.warning("OpenAI batch response is not a JSON object")
+        return None
+
+    return {pid: text.strip() for pid, text in data.items()
+            if pid in listed and isinstance(text, str) and text.strip()}
+
+
+def _enrich_in_batches(pending, deadline=None) -> List[Tuple[Dict[str, Any], str]]:
+    """Fill 'ai_details' with batch requests; returns the items still needing a per-place call."""
+    timeout = deadline.cap(AI_BATCH_TIMEOUT_SECONDS) if deadline else AI_BATCH_TIMEOUT_SECONDS
+    batches = ai_batches(pending)
+    futures = {_ai_executor.submit(generate_batch_details_with_ai, batch, timeout): batch for batch in batches}
+    done, not_done = wait(futures, timeout=timeout + 1)
+    for future in not_done:
+        future.cancel()
+
+    leftover = [item for future in not_done for item in futures[future]]
+    for future in done:
+        try:
+            texts = future.result()
+        except Exception as e:
+            print("OpenAI Error:", e)
+            texts = None
+        leftover += apply_batch_details(futures[future], texts)
+    return leftover
+
+
+def ai_batches(pending) -> List[List[Tuple[Dict[str, Any], str]]]:
+    """Split pending (place, category) items into batch requests according to AI_BATCH_SCOPE."""
+    if AI_BATCH_SCOPE != "category":
+        return [pending]
+    groups: Dict[str, list] = {}
+    for place, category in pending:
+        groups.setdefault(category, []).append((place, category))
+    return list(groups.values())
+
+
+def apply_batch_details(batch, texts) -> List[Tuple[Dict[str, Any], str]]:
+    """Store a batch reply's texts on its places and in ai_cache; returns the items it did not cover."""
+    leftover = []
+    for place, category in batch:
+        text = (texts or {}).get(place.place_id)
+        if text:
+            place.ai_details = text
+            ai_cache.set(place.place_id, category, text, prompt_hash=AI_BATCH_PROMPT_HASH)
+        else:
+            leftover.append((place, category))
+    return leftover
+
+
+def ai_prompt_hashes(batch_mode: bool) -> Tuple[str, str]:
+    """ai_cache lookup order: the mode's own prompt first, then the other mode's descriptions."""
+    return (AI_BATCH_PROMPT_HASH, AI_PROMPT_HASH) if batch_mode else (AI_PROMPT_HASH, AI_BATCH_PROMPT_HASH)
+
+
+def split_cached_ai_details(stops_by_category, prompt_hashes: Sequence[str]):
+    """
+    Fill 'ai_details' from ai_cache for the N best-ranked places of each category.
+    Returns ((category, place) items filled, (place, category) items still pending).
+    """
+    filled, pending = [], []
+    for category, places in stops_by_category.items():
+        for place in top_stops(places, MAX_AI_PLACES_PER_CATEGORY):
+            cached = ai_cache.get(place.place_id, category, prompt_hashes)
+            if cached is not None:
+                place.ai_details = cached
+                filled.append((category, place))
+            else:
+                pending.append((place, category))
+    return filled, pending
+
+
+def iter_ai_enrichment(stops_by_category, deadline=None):
+    """Add 'ai_details' to the top N places of each category, yielding (category, place) as they arrive."""
     if not openai_enabled:
         return
 
-    for category, places in stops_by_category.items():
-        for i, place in enumerate(places):
-            if i >= MAX_AI_PLACES_PER_CATEGORY:
-                break
-            ai_text = generate_place_details_with_ai(place, category)
+    batch_mode = AI_ENRICHMENT_MODE == "batch"
+    filled, pending = split_cached_ai_details(stops_by_category, ai_prompt_hashes(batch_mode))
+    yield from filled
+
+    if deadline is not None and deadline.expired:
+        return
+
+    if batch_mode and pending:
+        leftover = _enrich_in_batches(pending, deadline)
+        left_ids = {id(place) for place, _ in leftover}
+        for place, category in pending:
+            if id(place) not in left_ids and place.ai_details:
+                yield category, place
+        pending = leftover
+
+        usage = ai_usage.summary()
+        if "batch" in usage and "per_place" in usage:
+            app.logger.info(
+                "AI batch vs per-place: %.1f vs %.1f tokens/place, %.1f vs %.1f ms/place",
+                usage["batch"]["tokens_per_place"], usage["per_place"]["tokens_per_place"],
+                usage["batch"]["latency_ms_per_place"], usage["per_place"]["latency_ms_per_place"],
+            )
+
+    if not pending or (deadline is not None and deadline.expired):
+        return
+    call_timeout = deadline.cap(AI_CALL_TIMEOUT_SECONDS) if deadline else AI_CALL_TIMEOUT_SECONDS
+    futures = {}
+    for place, category in pending:
+        future = _ai_executor.submit(generate_place_details_with_ai, place, category,
+                                     use_cache=False, timeout=call_timeout)
+        futures[future] = (place, category)
+
+    # Calls queue behind each other once the pool is busy, so allow one timeout per wave
+    waves = -(-len(futures) // AI_CONCURRENCY)
+    wait_for = AI_CALL_TIMEOUT_SECONDS * waves + 1
+    if deadline is not None:
+        wait_for = deadline.cap(wait_for)
+    try:
+        for future in as_completed(futures, timeout=wait_for):
+            try:
+                ai_text = future.result()
+            except Exception as e:
+                print("OpenAI Error:", e)
+                continue
             if ai_text:
-                place["ai_details"] = ai_text
+                place, category = futures[future]
+                place.ai_details = ai_text
+                yield category, place
+    except FuturesTimeoutError:
+        pass  # late completions are dropped
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def enrich_stops_with_ai(stops_by_category):
+    """Add AI-generated 'ai_details' to top N places."""
+    for _ in iter_ai_enrichment(stops_by_category):
+        pass
 
 
 # --------- Routes --------- #
@@ -294,21 +2680,19 @@ def ping():
     return jsonify({"status": "ok"}), 200
 
 
-@app.route("/plan-trip", methods=["POST"])
-def plan_trip():
-    try:
-        data = request.get_json(silent=True) or {}
-    except Exception:
-        return jsonify({"error": True, "message": "Invalid JSON body"}), 400
-
+def parse_trip_request(data: Dict[str, Any]):
+    """
+    Validate a /plan-trip body. Returns (params, None) on success or
+    (None, (error_body, status)) for a 400 response.
+    """
     # Required fields
     required = ["from_place", "to_place", "trip_date", "vehicle_type", "preferences"]
     missing = [f for f in required if f not in data]
     if missing:
-        return jsonify({
+        return None, ({
             "error": True,
             "message": f"Missing required fields: {', '.join(missing)}"
-        }), 400
+        }, 400)
 
     from_place = data["from_place"]
     to_place = data["to_place"]
@@ -323,74 +2707,789 @@ def plan_trip():
     try:
         datetime.strptime(trip_date_str, "%Y-%m-%d")
     except:
-        return jsonify({"error": True, "message": "trip_date must be YYYY-MM-DD"}), 400
+        return None, ({"error": True, "message": "trip_date must be YYYY-MM-DD"}, 400)
 
     # Validate preferences
     invalid = [p for p in preferences if p not in CATEGORY_MAPPING]
     if invalid:
-        return jsonify({
+        return None, ({
             "error": True,
             "message": f"Invalid preferences: {', '.join(invalid)}",
             "allowed_preferences": list(CATEGORY_MAPPING.keys())
-        }), 400
+        }, 400)
 
     # Validate radius
     try:
         places_radius_km = int(places_radius_km)
     except:
-        return jsonify({"error": True, "message": "places_radius_km must be an integer"}), 400
+        return None, ({"error": True, "message": "places_radius_km must be an integer"}, 400)
 
     if places_radius_km not in ALLOWED_RADII_KM:
-        return jsonify({
+        return None, ({
             "error": True,
             "message": f"places_radius_km must be one of {ALLOWED_RADII_KM}"
-        }), 400
+        }, 400)
+
+    # Validate deadline
+    max_latency_ms = data.get("max_latency_ms", TRIP_MAX_LATENCY_MS or None)
+    if max_latency_ms is not None:
+        try:
+            max_latency_ms = int(max_latency_ms)
+        except (TypeError, ValueError):
+            max_latency_ms = 0
+        if max_latency_ms <= 0:
+            return None, ({"error": True, "message": "max_latency_ms must be a positive integer"}, 400)
+
+    # Validate stop ordering and filters
+    stops_order = data.get("stops_order", "route")
+    if stops_order not in STOP_ORDERS:
+        return None, ({"error": True, "message": f"stops_order must be one of {list(STOP_ORDERS)}"}, 400)
+    stop_filters = {}
+    for field in ("max_detour_km", "min_along_route_km", "max_along_route_km"):
+        value = data.get(field)
+        if value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = -1.0
+            if not math.isfinite(value) or value < 0:
+                return None, ({"error": True, "message": f"{field} must be a non-negative number"}, 400)
+        stop_filters[field] = value
+
+    # Validate stop field projection
+    fields, fields_error = parse_stop_fields(data.get("fields"))
+    if fields_error:
+        return None, ({"error": True, "message": fields_error, "allowed_fields": list(STOP_FIELDS)}, 400)
+
+    # Validate stop limit
+    max_stops = data.get("max_stops_per_category", MAX_STOPS_PER_CATEGORY or None)
+    if max_stops is not None:
+        try:
+            max_stops = int(max_stops)
+        except (TypeError, ValueError):
+            max_stops = 0
+        if max_stops <= 0:
+            return None, ({"error": True, "message": "max_stops_per_category must be a positive integer"}, 400)
 
+    return {
+        "from_place": from_place,
+        "to_place": to_place,
+        "trip_date": trip_date_str,
+        "vehicle_type": vehicle_type,
+        "preferences": preferences,
+        "via_places": via_places,
+        "places_radius_km": places_radius_km,
+        "max_latency_ms": max_latency_ms,
+        "stops_order": stops_order,
+        **stop_filters,
+        "max_stops_per_category": max_stops,
+        "fields": fields,
+    }, None
+
+
+def parse_stop_fields(value):
+    """Parse a fields= projection ("a,b" keeps, "-a" drops) into (fields or None, error or None)."""
+    if value is None or value == "":
+        return None, None
+    names = value.split(",") if isinstance(value, str) else value
+    if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+        return None, "fields must be a comma-separated string or a list of field names"
+    names = [n.strip() for n in names if n.strip()]
+    dropped = [n[1:] for n in names if n.startswith("-")]
+    if dropped and len(dropped) != len(names):
+        return None, "fields must either all be kept or all be dropped (prefixed with '-')"
+    unknown = [n for n in (dropped or names) if n not in STOP_FIELDS]
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+    if dropped:
+        return tuple(f for f in STOP_FIELDS if f not in dropped), None
+    return tuple(dict.fromkeys(names)), None
+
+
+def iter_trip_events(params: Dict[str, Any], call_log: Optional[list] = None):
+    """
+    Run the trip pipeline, yielding "route", "category" and "ai_details" events, then "done" or "error";
+    past max_latency_ms, unfinished work is dropped and the result marked partial.
+    """
+    preferences = params["preferences"]
+    places_radius_km = params["places_radius_km"]
     radius_meters = places_radius_km * 1000
+    deadline = trip_deadline(params)
 
+    started = time.perf_counter()
+    outcome = "error"
     try:
         # Geocode start/end
-        start_coords, start_fmt = geocode_place(from_place)
-        end_coords, end_fmt = geocode_place(to_place)
+        with timed_stage("geocode"):
+            start_coords, start_fmt = geocode_place(params["from_place"], deadline)
+            end_coords, end_fmt = geocode_place(params["to_place"], deadline)
 
-        # Optional via
-        via_coords = []
-        for v in via_places:
-            vc, _ = geocode_place(v)
-            via_coords.append(vc)
+            # Optional via
+            via_coords = []
+            for v in params["via_places"]:
+                vc, _ = geocode_place(v, deadline)
+                via_coords.append(vc)
 
         # Get route
-        route_info = get_route(start_coords, end_coords, vehicle_type, via_coords)
-
-        sampled_points = sample_route_points(route_info["polyline_points"], ROUTE_SAMPLING_STEP)
+        with timed_stage("directions"):
+            route_info = get_route(start_coords, end_coords, params["vehicle_type"], via_coords, deadline)
+        route = trip_route_summary(params, start_fmt, end_fmt, route_info)
+        yield {"event": "route", "route": route}
+
+        with timed_stage("sampling"):
+            sampled_points, sampling = sample_route(route_info["polyline_points"], places_radius_km)
+        app.logger.info(
+            "Route sampling (%s): %d centres vs %d with step sampling, %d Places calls saved",
+            sampling["mode"], sampling["sample_count"], sampling["step_sample_count"],
+            sampling["calls_saved_per_category"] * len(preferences),
+        )
 
-        # Find places
-        stops = {}
-        for category in preferences:
-            stops[category] = find_places_along_route(sampled_points, category, radius_meters)
+        # Find places: one fan-out over every (point, query) pair
+        places_calls = []
+        plan_stats = {}
+        found = {}
+        route_index = None
+        places_started = time.perf_counter()
+        for category, places in iter_places_for_categories(sampled_points, preferences, radius_meters,
+                                                           call_log=places_calls, plan_stats=plan_stats,
+                                                           max_calls=MAX_PLACES_CALLS_PER_TRIP,
+                                                           deadline=deadline, cutoff=sweep_cutoff(params)):
+            if route_index is None and places:
+                with timed_stage("route_index"):
+                    route_index = RouteIndex(route_info["polyline_points"],
+                                             route_index_cell_km(places_radius_km))
+            if route_index is not None:
+                places = arrange_stops(places, route_index, params)
+            found[category] = places
+            yield {"event": "category", "category": category, "stops": places}
+        _record_timing("places", time.perf_counter() - places_started)
+
+        stops, partial_reasons, incomplete = summarise_places(params, found, places_calls, plan_stats, deadline)
+        if call_log is not None:
+            call_log.extend(places_calls)
 
         # Add AI descriptions
-        enrich_stops_with_ai(stops)
-
-        return jsonify({
-            "route": {
-                "from": start_fmt,
-                "to": end_fmt,
-                "distance_km": round(route_info["distance_km"], 2),
-                "duration_minutes": round(route_info["duration_minutes"], 1),
-                "trip_date": trip_date_str,
-                "vehicle_type": vehicle_type,
-                "via_places": via_places,
-                "places_radius_km": places_radius_km,
-                "ai_details_enabled": openai_enabled,
-            },
-            "stops": stops
-        }), 200
-
-    except RuntimeError as e:
-        return jsonify({"error": True, "message": str(e)}), 502
+        ai_started = time.perf_counter()
+        for category, place in iter_ai_enrichment(stops, deadline):
+            yield {
+                "event": "ai_details",
+                "category": category,
+                "place_id": place.place_id,
+                "ai_details": place.ai_details,
+            }
+        if openai_enabled:
+            _record_timing("ai", time.perf_counter() - ai_started)
+            if deadline.expired and "deadline" not in partial_reasons:
+                partial_reasons.append("deadline")
+
+        outcome = "partial" if "deadline" in partial_reasons else "ok"
+        yield {"event": "done", "result": trip_result(route, stops, partial_reasons, incomplete)}
+
     except Exception as e:
-        return jsonify({"error": True, "message": f"Internal error: {e}"}), 500
+        outcome, event = trip_error_event(e, params, deadline)
+        yield event
+    finally:
+        TRIP_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+
+
+def sweep_cutoff(params: Dict[str, Any]) -> Optional[int]:
+    """Strong candidates per category after which the Places sweep may stop, if no stop filter applies."""
+    if any(params.get(f) is not None for f in ("max_detour_km", "min_along_route_km", "max_along_route_km")):
+        return None
+    return params.get("max_stops_per_category")
+
+
+def trip_deadline(params: Dict[str, Any]) -> Deadline:
+    """The Deadline for a trip's max_latency_ms (no deadline without one)."""
+    max_latency_ms = params.get("max_latency_ms")
+    return Deadline(max_latency_ms / 1000 if max_latency_ms else None)
+
+
+def trip_route_summary(params: Dict[str, Any], start_fmt: str, end_fmt: str,
+                       route_info: Dict[str, Any]) -> Dict[str, Any]:
+    """The "route" part of the /plan-trip response."""
+    return {
+        "from": start_fmt,
+        "to": end_fmt,
+        "distance_km": round(route_info["distance_km"], 2),
+        "duration_minutes": round(route_info["duration_minutes"], 1),
+        "trip_date": params["trip_date"],
+        "vehicle_type": params["vehicle_type"],
+        "via_places": params["via_places"],
+        "places_radius_km": params["places_radius_km"],
+        "ai_details_enabled": openai_enabled,
+    }
+
+
+def summarise_places(params, found, places_calls, plan_stats, deadline: Deadline):
+    """
+    Log a finished Places sweep and turn it into (stops per preference,
+    partial reasons, categories unfinished at the deadline).
+    """
+    app.logger.info(
+        "Places plan: %d queries per point, %d calls vs %d one-sweep-per-category (%d saved)",
+        plan_stats["queries"], plan_stats["planned_calls"],
+        plan_stats["naive_calls"], plan_stats["calls_saved"],
+    )
+    upstream_calls = [c for c in places_calls if not c["cached"]]
+    if upstream_calls:
+        latencies = [c["latency_ms"] for c in upstream_calls]
+        app.logger.info(
+            "Places fan-out: %d calls (%d from cache), avg %.1f ms, max %.1f ms",
+            len(latencies), len(places_calls) - len(upstream_calls),
+            sum(latencies) / len(latencies), max(latencies),
+        )
+        for c in upstream_calls:
+            app.logger.debug("Places call %s,%s %s -> %s in %.1f ms",
+                             c["lat"], c["lng"], c["type"], c["status"], c["latency_ms"])
+
+    if plan_stats.get("cut_off_categories"):
+        app.logger.info("Places sweep stopped early with enough strong candidates for: %s",
+                        ", ".join(plan_stats["cut_off_categories"]))
+
+    stops = {}
+    for category in params["preferences"]:
+        stops[category] = found.get(category, [])
+
+    partial_reasons = []
+    if plan_stats["budget_limited"]:
+        app.logger.warning(
+            "Places call budget %d reached: searched %d of %d sample points",
+            MAX_PLACES_CALLS_PER_TRIP, plan_stats["searched_points"], plan_stats["sample_points"],
+        )
+        partial_reasons.append("places_call_budget")
+    # Timeouts once the deadline has passed are reported as "deadline" below
+    if any(c["status"] != 200 or c["api_status"] not in ("OK", "ZERO_RESULTS")
+           for c in places_calls if not (deadline.expired and c["status"] == 504)):
+        partial_reasons.append("places_upstream_errors")
+    incomplete = [c for c in dict.fromkeys(params["preferences"]) if c not in found]
+    if incomplete:
+        app.logger.warning("Deadline of %s ms reached with %d categories unfinished",
+                           params.get("max_latency_ms"), len(incomplete))
+        partial_reasons.append("deadline")
+    return stops, partial_reasons, incomplete
+
+
+def trip_result(route, stops, partial_reasons, incomplete) -> Dict[str, Any]:
+    """The /plan-trip response body."""
+    result = {"route": route, "stops": stops, "partial": bool(partial_reasons)}
+    if partial_reasons:
+        result["partial_reasons"] = partial_reasons
+    if incomplete:
+        result["incomplete_categories"] = incomplete
+    return result
+
+
+def trip_error_event(e: Exception, params: Dict[str, Any], deadline: Deadline):
+    """Map a pipeline failure to (outcome label, error event)."""
+    if isinstance(e, RuntimeError):
+        return "upstream_error", {"event": "error", "status": 502, "error": True, "message": str(e)}
+    # An upstream call cut short by the deadline surfaces as a timeout of some kind
+    if isinstance(e, DeadlineExceeded) or deadline.expired:
+        return "deadline", {"event": "error", "status": 504, "error": True,
+                            "message": f"Route not ready within max_latency_ms={params['max_latency_ms']}"}
+    return "error", {"event": "error", "status": 500, "error": True, "message": f"Internal error: {e}"}
+
+
+def trip_request_key(params: Dict[str, Any]) -> str:
+    """Coalescing key for a /plan-trip payload: normalised endpoints, preferences as a set, fields ignored."""
+    normalised = dict(params)
+    normalised.pop("fields", None)   # projection is applied per response
+    normalised["from_place"] = normalize_address(params["from_place"])
+    normalised["to_place"] = normalize_address(params["to_place"])
+    normalised["preferences"] = sorted(set(params["preferences"]))
+    return json.dumps(normalised, sort_keys=True, default=str)
+
+
+def run_trip_plan(params: Dict[str, Any], call_log: Optional[list] = None) -> Tuple[Dict[str, Any], int]:
+    """Run the trip pipeline to completion and return (response body, status)."""
+    for event in iter_trip_events(params, call_log):
+        if event["event"] == "done":
+            return event["result"], 200
+        if event["event"] == "error":
+            return {"error": True, "message": event["message"]}, event["status"]
+    return {"error": True, "message": "Internal error: trip pipeline ended early"}, 500
+
+
+@app.route("/plan-trip", methods=["POST"])
+def plan_trip():
+    try:
+        data = request.get_json(silent=True) or {}
+    except Exception:
+        return jsonify({"error": True, "message": "Invalid JSON body"}), 400
+
+    params, error = parse_trip_request(with_query_fields(data))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # Identical trips planned at the same moment run once and share the response
+    body, status = trip_flight.do(trip_request_key(params), run_trip_plan, params)
+    return jsonify(project_result(body, params["fields"])), status
+
+
+@app.route("/plan-trip/stream", methods=["POST"])
+def plan_trip_stream():
+    """
+    Streaming /plan-trip. Sends one JSON event per line (application/x-ndjson),
+    or Server-Sent Events when the client accepts text/event-stream.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+    except Exception:
+        return jsonify({"error": True, "message": "Invalid JSON body"}), 400
+
+    params, error = parse_trip_request(with_query_fields(data))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    return event_stream(project_events(iter_trip_events(params), params["fields"]))
+
+
+def with_query_fields(data):
+    """Let ?fields= on the URL stand in for a "fields" key in the JSON body."""
+    if isinstance(data, dict) and "fields" not in data and "fields" in request.args:
+        return {**data, "fields": request.args["fields"]}
+    return data
+
+
+def project_result(body: Dict[str, Any], fields) -> Dict[str, Any]:
+    """A /plan-trip body (or partial result) with its stops cut down to `fields`; as is without a projection."""
+    if fields is None or not isinstance(body.get("stops"), dict):
+        return body
+    return {**body, "stops": {category: [p.to_json(fields) for p in places]
+                              for category, places in body["stops"].items()}}
+
+
+def project_events(events, fields):
+    """Trip pipeline events with stops cut down to `fields`; ai_details events are dropped along with the field."""
+    for event in events:
+        if fields is not None:
+            kind = event["event"]
+            if kind == "category":
+                event = {**event, "stops": [p.to_json(fields) for p in event["stops"]]}
+            elif kind == "ai_details" and "ai_details" not in fields:
+                continue
+            elif kind == "done":
+                event = {**event, "result": project_result(event["result"], fields)}
+        yield event
+
+
+def event_stream(events) -> Response:
+    """
+    Stream events as NDJSON, or as Server-Sent Events (named by each event's
+    "event" field) when the client accepts text/event-stream.
+    """
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+
+    def generate():
+        for event in events:
+            payload = app.json.dumps(event)
+            if sse:
+                yield f"event: {event['event']}\ndata: {payload}\n\n"
+            else:
+                yield payload + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --------- Metrics endpoint --------- #
+
+def _cache_metrics():
+    rows = []
+    for name, cache in (("places", places_cache), ("route", route_cache)):
+        stats = cache.stats()
+        rows += [({"cache": name, "result": "hit"}, stats["hits"]),
+                 ({"cache": name, "result": "miss"}, stats["misses"])]
+    geo = geocode_cache.stats()
+    rows += [({"cache": "geocode", "result": "memory_hit"}, geo["memory_hits"]),
+             ({"cache": "geocode", "result": "disk_hit"}, geo["disk_hits"]),
+             ({"cache": "geocode", "result": "negative_hit"}, geo["negative_hits"]),
+             ({"cache": "geocode", "result": "miss"}, geo["misses"])]
+    ai = ai_cache.stats()
+    rows += [({"cache": "ai_details", "result": "memory_hit"}, ai["memory_hits"]),
+             ({"cache": "ai_details", "result": "disk_hit"}, ai["disk_hits"]),
+             ({"cache": "ai_details", "result": "miss"}, ai["misses"])]
+    return rows
+
+
+def _cache_size_metrics():
+    rows = [({"cache": "places", "unit": "entries"}, len(places_cache)),
+            ({"cache": "route", "unit": "entries"}, len(route_cache)),
+            ({"cache": "route", "unit": "bytes"}, route_cache.stats()["bytes"]),
+            ({"cache": "geocode", "unit": "entries"}, len(geocode_cache.memory)),
+            ({"cache": "ai_details", "unit": "entries"}, len(ai_cache.memory))]
+    return rows
+
+
+def _ai_token_metrics():
+    rows = []
+    for mode, totals in ai_usage.summary().items():
+        rows += [({"mode": mode, "kind": "input"}, totals["input_tokens"]),
+                 ({"mode": mode, "kind": "output"}, totals["output_tokens"])]
+    return rows
+
+
+register_metric(CallbackMetric(
+    "cache_lookups_total", "Cache lookups by cache and result.", "counter", _cache_metrics))
+register_metric(CallbackMetric(
+    "cache_size", "Entries (or bytes) held in memory by each cache.", "gauge", _cache_size_metrics))
+register_metric(CallbackMetric(
+    "coalesced_calls_total", "Calls that waited on an identical in-flight call instead of running.",
+    "counter", lambda: [({"group": k}, v["coalesced"]) for k, v in coalescing_stats().items()]))
+register_metric(CallbackMetric(
+    "ai_tokens_total", "OpenAI tokens used by enrichment mode.", "counter", _ai_token_metrics))
+_BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+register_metric(CallbackMetric(
+    "circuit_breaker_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open).", "gauge",
+    lambda: [({"api": api}, _BREAKER_STATE_VALUES[b.state]) for api, b in circuit_breakers.items()]))
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.after_request
+def add_server_timing(response):
+    """Attach collected stage timings as a Server-Timing header when enabled."""
+    timings = g.get("server_timing")
+    if timings and (SERVER_TIMING or request.args.get("server_timing") == "1"):
+        response.headers["Server-Timing"] = ", ".join(
+            f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings
+        )
+    return response
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """The Content-Encoding to answer with for a parsed Accept-Encoding: "br" (with brotli), "gzip" or None."""
+    return accept_encodings.best_match(["br", "gzip"] if brotli is not None else ["gzip"])
+
+
+def compress_body(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+@app.after_request
+def compress_response(response):
+    """
+    gzip- or brotli-compress JSON bodies of at least COMPRESS_MIN_BYTES for
+    clients that accept it. Streamed responses are sent as they are.
+    """
+    if (COMPRESS_MIN_BYTES <= 0 or response.mimetype != "application/json" or response.is_streamed
+            or response.direct_passthrough or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+    with timed_stage("compress"):
+        response.set_data(compress_body(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+# --------- Background jobs --------- #
+
+class TripJob:
+    """One /jobs trip plan. Progress fields are only touched under `lock`."""
+
+    def __init__(self, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.lock = threading.Lock()
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.route: Optional[Dict[str, Any]] = None
+        self.stops: Dict[str, List[Dict[str, Any]]] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.future = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        """Record a pipeline event as partial (or final) job state."""
+        with self.lock:
+            kind = event["event"]
+            if kind == "route":
+                self.route = event["route"]
+            elif kind == "category":
+                self.stops[event["category"]] = [p.copy() for p in event["stops"]]
+            elif kind == "ai_details":
+                for place in self.stops.get(event["category"], []):
+                    if place.place_id == event["place_id"]:
+                        place.ai_details = event["ai_details"]
+            elif kind == "done":
+                self.result = event["result"]
+                self.status = "done"
+                self.finished_at = time.time()
+            elif kind == "error":
+                self.error = {"status": event["status"], "message": event["message"]}
+                self.status = "failed"
+                self.finished_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-ready view of the job for GET /jobs/<id>."""
+        with self.lock:
+            body = {
+                "job_id": self.id,
+                "status": self.status,
+                "cancel_requested": self.cancel_requested,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            fields = self.params.get("fields")
+            if self.status == "done":
+                body["result"] = project_result(self.result, fields)
+            else:
+                body["partial"] = project_result(copy.deepcopy({"route": self.route, "stops": self.stops}), fields)
+            if self.error:
+                body["error"] = self.error
+            return body
+
+
+class JobStore:
+    """Runs TripJobs on a bounded pool and keeps up to `max_finished` finished ones for `ttl_seconds`."""
+
+    def __init__(self, max_workers: int, max_pending: int, ttl_seconds: float, max_finished: int):
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, TripJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jobs")
+
+    def submit(self, params: Dict[str, Any]) -> Optional[TripJob]:
+        """Queue a job, or return None when too many are already waiting or running."""
+        with self._lock:
+            self._expire()
+            active = sum(1 for j in self._jobs.values() if not j.finished)
+            if active >= self.max_pending:
+                return None
+            job = TripJob(params)
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[TripJob]:
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[TripJob]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with job.lock:
+            if job.finished:
+                return job
+            job.cancel_requested = True
+            if job.future is not None and job.future.cancel():
+                job.status = "cancelled"
+                job.finished_at = time.time()
+        return job
+
+    def _run(self, job: TripJob) -> None:
+        with job.lock:
+            if job.cancel_requested:
+                # Cancelled after a worker took the job but before it started
+                job.status = "cancelled"
+                job.finished_at = time.time()
+                return
+            job.status = "running"
+            job.started_at = time.time()
+
+        events = iter_trip_events(job.params)
+        try:
+            for event in events:
+                if job.cancel_requested:
+                    break
+                job.apply(event)
+        finally:
+            events.close()   # cancels Places calls that have not started yet
+            with job.lock:
+                if not job.finished:
+                    job.status = "cancelled" if job.cancel_requested else "failed"
+                    job.finished_at = time.time()
+
+    def _expire(self) -> None:
+        """Drop expired finished jobs, then the oldest beyond max_finished. Caller holds the lock."""
+        now = time.time()
+        finished = [j for j in self._jobs.values() if j.finished]
+        for job in finished:
+            if job.finished_at and now - job.finished_at > self.ttl_seconds:
+                del self._jobs[job.id]
+        finished = [j for j in finished if j.id in self._jobs]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+
+job_store = JobStore(JOB_MAX_WORKERS, JOB_MAX_PENDING, JOB_TTL_SECONDS, JOB_MAX_FINISHED)
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """Queue a /plan-trip body as a background job and return its id right away."""
+    try:
+        data = request.get_json(silent=True) or {}
+    except Exception:
+        return jsonify({"error": True, "message": "Invalid JSON body"}), 400
+
+    params, error = parse_trip_request(with_query_fields(data))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    job = job_store.submit(params)
+    if job is None:
+        return jsonify({"error": True, "message": "Too many trip jobs in progress, retry later"}), 503
+
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "cancel_url": f"/jobs/{job.id}/cancel",
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": True, "message": "Job not found"}), 404
+    return jsonify(job.snapshot()), 200
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job = job_store.cancel(job_id)
+    if job is None:
+        return jsonify({"error": True, "message": "Job not found"}), 404
+    return jsonify(job.snapshot()), 200
+
+
+# --------- Batch planning --------- #
+
+# Trips of a /plan-trips batch run here; their Places calls share the Places pool
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch")
+
+
+def _settle(fn, *args):
+    """Call fn(*args) and return (result, None), or (None, exception) if it raised."""
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
+
+
+def prefetch_batch(trips: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """Geocode every distinct address and route every distinct trip of a batch once; returns counts."""
+    places = [p for params in trips for p in (params["from_place"], params["to_place"], *params["via_places"])]
+    addresses = {}
+    for place in places:
+        addresses.setdefault(normalize_address(place), place)
+    geocoded = dict(zip(addresses, _run_bounded(
+        _settle, [(geocode_place, place) for place in addresses.values()], PLACES_CONCURRENCY)))
+
+    routes = {}
+    for params in trips:
+        found = [geocoded[normalize_address(p)][0]
+                 for p in (params["from_place"], params["to_place"], *params["via_places"])]
+        if any(f is None for f in found):
+            continue
+        start, end, via = found[0][0], found[1][0], [coords for coords, _ in found[2:]]
+        key = route_cache_key(start, end, map_vehicle_to_mode(params["vehicle_type"]), via)
+        routes.setdefault(key, (get_route, start, end, params["vehicle_type"], via))
+    _run_bounded(_settle, list(routes.values()), PLACES_CONCURRENCY)
+
+    return {
+        "geocodes": {"requested": len(places), "unique": len(addresses)},
+        "routes": {"requested": len(trips), "unique": len(routes)},
+    }
+
+
+def iter_batch_events(payloads: List[Any]):
+    """Plan a batch of payloads, yielding a "trip" event per payload as it finishes, then a "summary"."""
+    started = time.perf_counter()
+    statuses = []
+    groups: Dict[str, Tuple[Dict[str, Any], List[Tuple[int, Any]]]] = {}
+    for index, data in enumerate(payloads):
+        params, error = parse_trip_request(data if isinstance(data, dict) else {})
+        if error:
+            statuses.append(error[1])
+            yield {"event": "trip", "index": index, "status": error[1], "result": error[0]}
+        else:
+            groups.setdefault(trip_request_key(params), (params, []))[1].append((index, params["fields"]))
+
+    # Every valid payload counts towards what the batch asked for, duplicates included
+    shared = prefetch_batch([params for params, indexes in groups.values() for _ in indexes])
+
+    call_log = []
+    futures = {_batch_executor.submit(run_trip_plan, params, call_log): indexes
+               for params, indexes in groups.values()}
+    try:
+        for future in as_completed(futures):
+            body, status = future.result()
+            for index, fields in futures[future]:
+                statuses.append(status)
+                yield {"event": "trip", "index": index, "status": status, "result": project_result(body, fields)}
+    finally:
+        for future in futures:
+            future.cancel()
+
+    seconds = time.perf_counter() - started
+    from_cache = sum(1 for c in call_log if c["cached"])
+    coalesced = sum(1 for c in call_log if c["coalesced"])
+    yield {
+        "event": "summary",
+        "trips": len(payloads),
+        "distinct_trips": len(groups),
+        "succeeded": sum(1 for s in statuses if s == 200),
+        "failed": sum(1 for s in statuses if s != 200),
+        "seconds": round(seconds, 3),
+        "trips_per_second": round(len(payloads) / seconds, 2) if seconds else None,
+        **shared,
+        "places_calls": {
+            "requested": len(call_log),
+            "from_cache": from_cache,
+            "coalesced": coalesced,
+            "upstream": len(call_log) - from_cache - coalesced,
+        },
+    }
+
+
+@app.route("/plan-trips", methods=["POST"])
+def plan_trips():
+    """
+    Batch /plan-trip: {"trips": [payload, ...]} (or a bare list). Streams one
+    result per trip as NDJSON (or SSE) followed by a throughput summary.
+    """
+    data = request.get_json(silent=True)
+    trips = data.get("trips") if isinstance(data, dict) else data
+    if not isinstance(trips, list) or not trips:
+        return jsonify({"error": True, "message": "Body must be {\"trips\": [...]} with at least one trip"}), 400
+    if len(trips) > BATCH_MAX_TRIPS:
+        return jsonify({"error": True, "message": f"At most {BATCH_MAX_TRIPS} trips per batch"}), 400
+
+    return event_stream(iter_batch_events(trips))
 
 
 if __name__ == "__main__":
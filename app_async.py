@@ -0,0 +1,562 @@
+"""
+Async server mode for the trip planner.
+
+Serves the same /plan-trip and /ping contract as app.py, but every upstream
+call (Geocoding, Directions, Places, OpenAI) is awaited on one event loop
+through httpx.AsyncClient and AsyncOpenAI instead of holding a worker thread,
+so a single process can keep hundreds of trips in flight.
+
+Configuration, caches, rate limits, circuit breakers, the Places query
+planner, prompts, request validation and metrics all come from app.py; only
+the I/O is reimplemented here. Cache lookups and writes that can reach SQLite
+run in worker threads (asyncio.to_thread) so they never stall the loop.
+
+    pip install quart hypercorn httpx
+    hypercorn app_async:app --bind 0.0.0.0:5000
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+from quart import Quart, Response, jsonify, request
+from quart.wrappers.response import DataBody
+
+import app as planner
+from app import DeadlineExceeded, UpstreamRateLimited, UpstreamUnavailable
+
+app = Quart(__name__)
+app.json = planner.PlannerJSONProvider(app)
+
+# Connections the shared async HTTP client may open across all in-flight trips
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_MAX_CONNECTIONS", "200"))
+
+http_client: Optional[httpx.AsyncClient] = None
+openai_client: Optional[AsyncOpenAI] = None
+# Process-wide cap on concurrent OpenAI calls, like app.py's AI pool
+ai_slots: Optional[asyncio.Semaphore] = None
+
+
+@app.before_serving
+async def open_clients():
+    global http_client, openai_client, ai_slots
+    http_client = httpx.AsyncClient(limits=httpx.Limits(
+        max_connections=ASYNC_MAX_CONNECTIONS,
+        max_keepalive_connections=planner.HTTP_POOL_SIZE,
+    ))
+    if planner.openai_enabled:
+        # No SDK retries, as in app.build_openai_client: the per-call timeout bounds each call
+        openai_client = AsyncOpenAI(api_key=planner.OPENAI_API_KEY, base_url=planner.OPENAI_BASE_URL,
+                                    max_retries=0)
+    ai_slots = asyncio.Semaphore(planner.AI_CONCURRENCY)
+
+
+@app.after_serving
+async def close_clients():
+    await http_client.aclose()
+    if openai_client is not None:
+        await openai_client.close()
+
+
+# --------- Request coalescing --------- #
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines; callers await the shared task through shield, so it outlives them."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Any, asyncio.Future] = {}
+        self._deadlines: Dict[Any, planner.FlightDeadline] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args):
+        return await asyncio.shield(self._join(key, fn, args))
+
+    async def do_within(self, deadline, key, fn, *args):
+        """Async counterpart of SingleFlight.do_within."""
+        return (await self.join_within(deadline, key, fn, *args))[0]
+
+    async def join_within(self, deadline, key, fn, *args) -> Tuple[Any, bool]:
+        """do_within, returning (result, whether this caller joined a call another caller started)."""
+        joined = key in self._flights
+        flight = self._join(key, fn, args, deadline, within=True)
+        done, _ = await asyncio.wait({flight}, timeout=deadline.remaining() if deadline is not None else None)
+        if not done:
+            raise DeadlineExceeded("Trip deadline exceeded")
+        return flight.result(), joined
+
+    def _join(self, key, fn, args, deadline=None, within=False) -> asyncio.Future:
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            if key in self._deadlines:
+                self._deadlines[key].extend(deadline)
+            return flight
+        self.executed += 1
+        if within:
+            flight_deadline = self._deadlines[key] = planner.FlightDeadline(deadline)
+            args = args + (flight_deadline,)
+        flight = self._flights[key] = asyncio.ensure_future(fn(*args))
+        flight.add_done_callback(lambda done: self._land(key, done))
+        return flight
+
+    def _land(self, key, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+            self._deadlines.pop(key, None)
+        if not flight.cancelled():
+            flight.exception()   # retrieved here, so a flight every caller gave up on is not reported
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+geocode_flight = AsyncSingleFlight("geocode")
+route_flight = AsyncSingleFlight("directions")
+places_flight = AsyncSingleFlight("places")
+trip_flight = AsyncSingleFlight("plan_trip")
+# /metrics reports these instead of app.py's thread single-flights, which this mode never uses
+planner.flight_groups[:] = [trip_flight, geocode_flight, route_flight, places_flight]
+
+
+# --------- HTTP client --------- #
+
+async def acquire_token(api: str, timeout: float) -> bool:
+    """Take a token from the API's bucket without blocking the loop; False if none comes in time."""
+    limiter = planner.rate_limiters.get(api)
+    if limiter is None:
+        return True
+    give_up = time.monotonic() + timeout
+    while not limiter.acquire(0):
+        left = give_up - time.monotonic()
+        if left <= 0:
+            return False
+        await asyncio.sleep(min(1 / limiter.rate, left))
+    return True
+
+
+async def http_get(url: str, params: Dict[str, Any], api: str = "other",
+                   timeout: Optional[float] = None, deadline=None) -> httpx.Response:
+    """Async counterpart of app.http_get: circuit breaker, rate limit, then one (or a hedged) call."""
+    if timeout is None:
+        timeout = planner.request_timeout(deadline)
+    breaker = planner.circuit_breakers.get(api)
+    if breaker is not None and not breaker.allow():
+        planner.record_upstream(api, "circuit_open", 0.0)
+        raise UpstreamUnavailable(f"{api} is unavailable (circuit breaker open)")
+
+    started = time.perf_counter()
+    if not await acquire_token(api, timeout):
+        planner.record_upstream(api, "rate_limited", time.perf_counter() - started)
+        raise UpstreamRateLimited(f"{api} rate limit exceeded")
+
+    if api in planner.latency_windows:
+        return await _hedged_send(url, params, api, timeout, deadline)
+    return await _send(url, params, api, timeout, deadline)
+
+
+async def _send(url: str, params: Dict[str, Any], api: str, timeout: float, deadline=None) -> httpx.Response:
+    """One upstream call, retried on 429/5xx and transport errors like app._send."""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        for attempt in range(planner.HTTP_MAX_RETRIES + 1):
+            try:
+                resp = await http_client.get(url, params=params,
+                                             timeout=timeout if attempt == 0 else planner.request_timeout(deadline))
+            except httpx.TransportError:
+                backoff = planner.retry_backoff(attempt, deadline)
+                if backoff is None:
+                    raise
+            else:
+                status = resp.status_code
+                backoff = planner.retry_backoff(attempt, deadline) if status in planner.RETRY_STATUS_CODES else None
+                if backoff is None:
+                    return resp
+            await asyncio.sleep(backoff)
+    finally:
+        planner.observe_attempt(api, status, time.perf_counter() - started)
+
+
+async def _hedged_send(url: str, params: Dict[str, Any], api: str, timeout: float,
+                       deadline=None) -> httpx.Response:
+    """Async counterpart of app._hedged_send; the losing attempt is cancelled."""
+    delay = planner.latency_windows[api].percentile(planner.HEDGE_PERCENTILE)
+    if delay is None:
+        return await _send(url, params, api, timeout, deadline)
+
+    primary = asyncio.ensure_future(_send(url, params, api, timeout, deadline))
+    done, _ = await asyncio.wait({primary}, timeout=max(delay, planner.HEDGE_MIN_DELAY_MS / 1000))
+    if done:
+        return primary.result()
+
+    limiter = planner.rate_limiters.get(api)
+    if limiter is not None and not limiter.acquire(0):
+        planner.UPSTREAM_HEDGES.inc(api=api, result="skipped")
+        return await primary
+
+    planner.UPSTREAM_HEDGES.inc(api=api, result="sent")
+    hedge = asyncio.ensure_future(_send(url, params, api, timeout, deadline))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                planner.UPSTREAM_HEDGES.inc(api=api, result="won" if future is hedge else "lost")
+                return future.result()
+        raise error
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# --------- External API wrappers --------- #
+
+async def geocode_place(place: str, deadline=None) -> Tuple[Tuple[float, float], str]:
+    cached = await asyncio.to_thread(planner.geocode_cache_lookup, place)
+    if cached is not None:
+        return cached
+    try:
+        return await geocode_flight.do_within(deadline, planner.normalize_address(place), _geocode_upstream, place)
+    except UpstreamUnavailable:
+        stale = planner.stale_geocode(place)
+        if stale is None:
+            raise
+        return stale
+
+
+async def _geocode_upstream(place: str, deadline=None) -> Tuple[Tuple[float, float], str]:
+    url, params = planner.geocode_request(place)
+    resp = await http_get(url, params, api="geocode", deadline=deadline)
+    return await asyncio.to_thread(planner.geocode_answer, place, resp.status_code,
+                                   resp.json() if resp.status_code == 200 else None)
+
+
+async def get_route(start_coords, end_coords, vehicle_type, via_coords=None, deadline=None):
+    mode = planner.map_vehicle_to_mode(vehicle_type)
+    key = planner.route_cache_key(start_coords, end_coords, mode, via_coords)
+    cached = planner.route_cache_lookup(key)
+    if cached is not None:
+        return cached
+    try:
+        return await route_flight.do_within(deadline, key, _route_upstream, key, start_coords, end_coords,
+                                            mode, via_coords)
+    except UpstreamUnavailable:
+        stale = planner.stale_route(key)
+        if stale is None:
+            raise
+        return stale
+
+
+async def _route_upstream(key, start_coords, end_coords, mode, via_coords, deadline=None):
+    url, params = planner.route_request(start_coords, end_coords, mode, via_coords)
+    resp = await http_get(url, params, api="directions", deadline=deadline)
+    # Off the loop: decoding a long polyline is CPU work
+    return await asyncio.to_thread(planner.route_answer, key, resp.status_code,
+                                   resp.json() if resp.status_code == 200 else None)
+
+
+async def nearby_search(lat, lng, place_type, keyword, radius_meters, deadline=None) -> Dict[str, Any]:
+    url, params = planner.nearby_request(lat, lng, place_type, keyword, radius_meters)
+    started = time.perf_counter()
+    resp = None
+    try:
+        resp = await http_get(url, params, api="places", deadline=deadline)
+        status = resp.status_code
+    except UpstreamRateLimited:
+        status = 429
+    except UpstreamUnavailable:
+        status = 503
+    except (DeadlineExceeded, httpx.HTTPError):
+        status = 504
+    latency_ms = (time.perf_counter() - started) * 1000
+    return planner.nearby_call(lat, lng, place_type, keyword, status,
+                               resp.json() if status == 200 else {}, latency_ms)
+
+
+async def cached_nearby_search(lat, lng, place_type, keyword, radius_meters, deadline=None) -> Dict[str, Any]:
+    key, (clat, clng), hit = planner.places_cache_lookup(lat, lng, place_type, keyword, radius_meters)
+    if hit is not None:
+        return hit
+    started = time.perf_counter()
+    try:
+        shared, coalesced = await places_flight.join_within(deadline, key, _nearby_upstream, key, clat, clng,
+                                                            place_type, keyword, radius_meters)
+        call = dict(shared)
+    except DeadlineExceeded:
+        call = planner.nearby_call(clat, clng, place_type, keyword, 504, {}, (time.perf_counter() - started) * 1000)
+        coalesced = False
+    call["cached"] = False
+    call["coalesced"] = coalesced
+    return call
+
+
+async def _nearby_upstream(key, lat, lng, place_type, keyword, radius_meters, deadline=None):
+    return planner.store_nearby_answer(key, await nearby_search(lat, lng, place_type, keyword,
+                                                                radius_meters, deadline))
+
+
+# --------- Places search --------- #
+
+async def iter_sweep(queries, centres, radius_meters, call_log, deadline=None, enough=None):
+    """Async counterpart of app._iter_sweep."""
+    n = len(centres)
+    if n == 0:
+        for query in queries:
+            yield query, []
+        return
+
+    slots = asyncio.Semaphore(planner.PLACES_CONCURRENCY)
+    finished = [False] * len(queries)
+
+    async def search(i, lat, lng, query):
+        async with slots:
+            if finished[i // n]:
+                return i, None
+            return i, await cached_nearby_search(lat, lng, query["type"], query["keyword"],
+                                                 radius_meters, deadline)
+
+    tasks = [asyncio.ensure_future(search(q * n + c, lat, lng, query))
+             for q, query in enumerate(queries) for c, (lat, lng) in enumerate(centres)]
+    calls = [None] * len(tasks)
+    remaining = [n] * len(queries)
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=deadline.remaining() if deadline else None):
+            i, call = await next_done
+            if call is None:
+                continue
+            calls[i] = call
+            if call_log is not None:
+                call_log.append({k: v for k, v in call.items() if k != "results"})
+            q = i // n
+            if finished[q]:
+                continue
+            remaining[q] -= 1
+            if remaining[q] == 0 or (enough is not None and enough(queries[q], call)):
+                finished[q] = True
+                yield queries[q], [c for c in calls[q * n:(q + 1) * n] if c is not None]
+    except asyncio.TimeoutError:
+        return
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def find_places_for_categories(points, categories, radius_meters, call_log=None, deadline=None,
+                                     cutoff=None):
+    """Async counterpart of app.iter_places_for_categories, collected into (found, plan stats)."""
+    sweep = planner.PlacesSweep(points, categories, radius_meters, planner.MAX_PLACES_CALLS_PER_TRIP, cutoff)
+    enough = sweep.enough if cutoff else None
+    found = {}
+    async for query, calls in iter_sweep(sweep.queries, sweep.centres, radius_meters, call_log, deadline,
+                                         enough):
+        found.update(sweep.resolve(query, calls))
+    found.update(sweep.unfinished())
+    return found, sweep.stats()
+
+
+# --------- ChatGPT integration --------- #
+
+async def describe_place(place, category, timeout: float) -> Optional[str]:
+    """Async counterpart of app.generate_place_details_with_ai (without the cache lookup)."""
+    async with ai_slots:
+        started = time.perf_counter()
+        try:
+            response = await openai_client.responses.create(
+                model=planner.OPENAI_MODEL,
+                input=planner.place_prompt(place, category),
+                timeout=timeout,
+            )
+        except Exception as e:
+            planner.record_upstream("openai", "error", time.perf_counter() - started)
+            print("OpenAI Error:", e)
+            return None
+    planner.record_upstream("openai", "ok", time.perf_counter() - started)
+    planner.ai_usage.record("per_place", response, (time.perf_counter() - started) * 1000, 1)
+
+    text = getattr(response, "output_text", None)
+    if text:
+        await asyncio.to_thread(planner.ai_cache.set, place.place_id, category, text)
+    return text
+
+
+async def describe_batch(items, timeout: float) -> Optional[Dict[str, str]]:
+    """Async counterpart of app.generate_batch_details_with_ai."""
+    listed, prompt = planner.batch_prompt(items)
+    async with ai_slots:
+        started = time.perf_counter()
+        try:
+            response = await openai_client.responses.create(
+                model=planner.OPENAI_MODEL,
+                input=prompt,
+                text={"format": {"type": "json_object"}},
+                timeout=timeout,
+            )
+        except Exception as e:
+            planner.record_upstream("openai", "error", time.perf_counter() - started)
+            print("OpenAI Error:", e)
+            return None
+    planner.record_upstream("openai", "ok", time.perf_counter() - started)
+    planner.ai_usage.record("batch", response, (time.perf_counter() - started) * 1000, len(listed))
+    return planner.parse_batch_output(listed, getattr(response, "output_text", None))
+
+
+async def _gather_until(coros, timeout: Optional[float]) -> List[Any]:
+    """Run coroutines concurrently; results not back within `timeout` are None (and cancelled)."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    if not tasks:
+        return []
+    done, not_done = await asyncio.wait(tasks, timeout=timeout)
+    for task in not_done:
+        task.cancel()
+    return [t.result() if t in done and t.exception() is None else None for t in tasks]
+
+
+async def enrich_stops_with_ai(stops_by_category, deadline=None) -> None:
+    """Async counterpart of app.iter_ai_enrichment: fill 'ai_details' on the top N places."""
+    if openai_client is None:
+        return
+
+    batch_mode = planner.AI_ENRICHMENT_MODE == "batch"
+    _, pending = await asyncio.to_thread(planner.split_cached_ai_details, stops_by_category,
+                                         planner.ai_prompt_hashes(batch_mode))
+    if not pending or (deadline is not None and deadline.expired):
+        return
+
+    if batch_mode:
+        timeout = deadline.cap(planner.AI_BATCH_TIMEOUT_SECONDS) if deadline else planner.AI_BATCH_TIMEOUT_SECONDS
+        batches = planner.ai_batches(pending)
+        replies = await _gather_until([describe_batch(b, timeout) for b in batches], timeout + 1)
+        leftovers = await asyncio.gather(*[asyncio.to_thread(planner.apply_batch_details, batch, texts)
+                                           for batch, texts in zip(batches, replies)])
+        pending = [item for leftover in leftovers for item in leftover]
+        if not pending or (deadline is not None and deadline.expired):
+            return
+
+    timeout = deadline.cap(planner.AI_CALL_TIMEOUT_SECONDS) if deadline else planner.AI_CALL_TIMEOUT_SECONDS
+    # Calls queue for ai_slots once the cap is reached, so allow one timeout per wave
+    waves = -(-len(pending) // planner.AI_CONCURRENCY)
+    wait_for = planner.AI_CALL_TIMEOUT_SECONDS * waves + 1
+    if deadline is not None:
+        wait_for = deadline.cap(wait_for)
+    texts = await _gather_until([describe_place(p, c, timeout) for p, c in pending], wait_for)
+    for (place, _), text in zip(pending, texts):
+        if text:
+            place.ai_details = text
+
+
+# --------- Routes --------- #
+
+async def run_trip_plan(params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Async counterpart of app.run_trip_plan; start, end and via points are geocoded concurrently."""
+    deadline = planner.trip_deadline(params)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with planner.timed_stage("geocode"):
+            geocoded = await asyncio.gather(*(
+                geocode_place(p, deadline)
+                for p in [params["from_place"], params["to_place"], *params["via_places"]]
+            ))
+        (start_coords, start_fmt), (end_coords, end_fmt) = geocoded[:2]
+        via_coords = [coords for coords, _ in geocoded[2:]]
+
+        with planner.timed_stage("directions"):
+            route_info = await get_route(start_coords, end_coords, params["vehicle_type"], via_coords, deadline)
+        route = planner.trip_route_summary(params, start_fmt, end_fmt, route_info)
+
+        with planner.timed_stage("sampling"):
+            sampled_points, _ = planner.sample_route(route_info["polyline_points"], params["places_radius_km"])
+
+        places_calls = []
+        with planner.timed_stage("places"):
+            found, plan_stats = await find_places_for_categories(
+                sampled_points, params["preferences"], params["places_radius_km"] * 1000,
+                call_log=places_calls, deadline=deadline, cutoff=planner.sweep_cutoff(params),
+            )
+        if any(found.values()):
+            with planner.timed_stage("route_index"):
+                route_index = planner.RouteIndex(route_info["polyline_points"],
+                                                 planner.route_index_cell_km(params["places_radius_km"]))
+            found = {category: planner.arrange_stops(places, route_index, params)
+                     for category, places in found.items()}
+        stops, partial_reasons, incomplete = planner.summarise_places(
+            params, found, places_calls, plan_stats, deadline)
+
+        if openai_client is not None:
+            with planner.timed_stage("ai"):
+                await enrich_stops_with_ai(stops, deadline)
+            if deadline.expired and "deadline" not in partial_reasons:
+                partial_reasons.append("deadline")
+
+        outcome = "partial" if "deadline" in partial_reasons else "ok"
+        return planner.trip_result(route, stops, partial_reasons, incomplete), 200
+
+    except Exception as e:
+        outcome, event = planner.trip_error_event(e, params, deadline)
+        return {"error": True, "message": event["message"]}, event["status"]
+    finally:
+        planner.TRIP_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+
+
+@app.route("/ping", methods=["GET"])
+async def ping():
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route("/plan-trip", methods=["POST"])
+async def plan_trip():
+    data = await request.get_json(silent=True) or {}
+    if isinstance(data, dict) and "fields" not in data and "fields" in request.args:
+        data = {**data, "fields": request.args["fields"]}
+    params, error = planner.parse_trip_request(data)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # Identical trips planned at the same moment run once and share the response
+    body, status = await trip_flight.do(planner.trip_request_key(params), run_trip_plan, params)
+    return jsonify(planner.project_result(body, params["fields"])), status
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    return Response(planner.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.after_request
+async def add_cors_headers(response):
+    """Same open CORS policy as flask_cors.CORS(app) in app.py."""
+    response.headers.setdefault("Access-Control-Allow-Origin", "*")
+    if request.method == "OPTIONS":
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        requested = request.headers.get("Access-Control-Request-Headers")
+        if requested:
+            response.headers["Access-Control-Allow-Headers"] = requested
+    return response
+
+
+@app.after_request
+async def compress_response(response):
+    """Same gzip/brotli compression of JSON bodies as app.py."""
+    if (planner.COMPRESS_MIN_BYTES <= 0 or response.mimetype != "application/json"
+            or not isinstance(response.response, DataBody) or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = planner.negotiate_encoding(request.accept_encodings)
+    if encoding is None or (response.content_length or 0) < planner.COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(planner.compress_body(await response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
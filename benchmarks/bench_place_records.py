@@ -0,0 +1,146 @@
+"""
+Place record memory and serialisation benchmark
+
+Measures, with tracemalloc, how much memory a place costs as an
+app.PlaceRecord against the dicts used before: the trimmed copy of the
+Nearby Search result kept in places_cache plus the stop dict built per
+trip. It also times serialising a /plan-trip sized stop list both ways,
+after checking that the JSON is identical.
+
+Usage:
+    python benchmarks/bench_place_records.py [--places 20000] [--stops 2000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+TYPES = [["restaurant", "food", "point_of_interest", "establishment"],
+         ["natural_feature", "establishment"],
+         ["hindu_temple", "place_of_worship", "point_of_interest", "establishment"],
+         ["amusement_park", "tourist_attraction", "point_of_interest", "establishment"]]
+
+# What places_cache kept and how stops were built before PlaceRecord
+DICT_CACHED_FIELDS = ("place_id", "name", "geometry", "vicinity", "rating",
+                      "user_ratings_total", "opening_hours", "types")
+
+
+def dict_cache_entry(place):
+    return {f: place[f] for f in DICT_CACHED_FIELDS if f in place}
+
+
+def dict_stop(place):
+    pid = place["place_id"]
+    loc = place["geometry"]["location"]
+    entry = {
+        "name": place.get("name"),
+        "lat": loc.get("lat"),
+        "lon": loc.get("lng"),
+        "address": place.get("vicinity"),
+        "rating": place.get("rating"),
+        "user_ratings_total": place.get("user_ratings_total"),
+        "place_id": pid,
+        "maps_url": app.build_maps_url(pid),
+    }
+    if place.get("opening_hours"):
+        entry["opening_hours"] = place["opening_hours"]
+    entry["distance_along_route_km"] = None
+    entry["detour_km"] = None
+    return entry
+
+
+def nearby_payload(rng: random.Random, n: int) -> str:
+    """A JSON body of n Nearby Search results shaped like the real API's."""
+    results = []
+    for i in range(n):
+        lat, lng = 12 + rng.random() * 2, 79 + rng.random() * 2
+        results.append({
+            "place_id": f"ChIJ{i:012d}{rng.getrandbits(40):010x}",
+            "name": f"Place {i} {rng.choice(['Bhavan', 'Beach', 'Temple', 'Park', 'Cafe'])}",
+            "geometry": {
+                "location": {"lat": lat, "lng": lng},
+                "viewport": {"northeast": {"lat": lat + 0.001, "lng": lng + 0.001},
+                             "southwest": {"lat": lat - 0.001, "lng": lng - 0.001}},
+            },
+            "vicinity": f"{rng.randint(1, 200)} Main Road, Town {rng.randint(1, 500)}",
+            "rating": round(rng.uniform(3, 5), 1),
+            "user_ratings_total": rng.randint(1, 5000),
+            "opening_hours": {"open_now": rng.random() < 0.7},
+            "types": list(rng.choice(TYPES)),
+            "business_status": "OPERATIONAL",
+            "icon": "https://maps.gstatic.com/mapfiles/place_api/icons/v1/png_71/generic_business-71.png",
+            "reference": f"ChIJ{i:012d}",
+        })
+    return json.dumps(results)
+
+
+def measure(build, inputs) -> float:
+    """Bytes per item still held by build(inputs()) once the inputs themselves are released."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = inputs()
+    held = build(items)
+    count = len(items)
+    del items
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return (after - before) / count
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--places", type=int, default=20000, help="places for the memory measurement")
+    parser.add_argument("--stops", type=int, default=2000, help="stops in the serialised response")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payload = nearby_payload(rng, args.places)
+    results = json.loads(payload)
+    records = [app.PlaceRecord.from_result(p) for p in results]
+    cached = [dict_cache_entry(p) for p in results]
+
+    # Cache entries outlive the parsed response; stops are built from cache entries
+    cached_dict = measure(lambda rs: [dict_cache_entry(p) for p in rs], lambda: json.loads(payload))
+    cached_record = measure(lambda rs: [app.PlaceRecord.from_result(p) for p in rs], lambda: json.loads(payload))
+    stop_dict = measure(lambda rs: [dict_stop(p) for p in rs], lambda: list(cached))
+    stop_record = measure(lambda rs: [r.copy() for r in rs], lambda: list(records))
+
+    print(f"memory per place ({args.places} places)")
+    print(f"  {'':22} {'dict':>9} {'PlaceRecord':>12}")
+    print(f"  {'places_cache entry':22} {cached_dict:8.0f}B {cached_record:11.0f}B")
+    print(f"  {'stop (per trip)':22} {stop_dict:8.0f}B {stop_record:11.0f}B")
+
+    stops = {"Restaurant": records[:args.stops]}
+    as_dicts = {"Restaurant": [dict_stop(p) for p in results[:args.stops]]}
+    encoded = app.app.json.dumps(stops)
+    if encoded != app.app.json.dumps(as_dicts):
+        raise SystemExit("PlaceRecord stops serialise differently from the dict stops")
+
+    dict_time = best_of(lambda: app.app.json.dumps(as_dicts), args.repeat)
+    record_time = best_of(lambda: app.app.json.dumps(stops), args.repeat)
+    print(f"serialising {args.stops} stops ({len(encoded)} bytes, identical JSON)")
+    print(f"  dict stops             {dict_time * 1000:9.2f} ms")
+    print(f"  PlaceRecord.to_json    {record_time * 1000:9.2f} ms  ({record_time / dict_time:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
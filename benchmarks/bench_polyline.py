@@ -0,0 +1,88 @@
+"""
+Polyline decoder microbenchmark
+
+Compares app.decode_polyline (pure Python) with the NumPy decoders
+app.decode_polyline_array and app.decode_polylines, after checking that
+they agree bit-for-bit on valid and truncated input.
+
+Usage:
+    python benchmarks/bench_polyline.py [--points 20000] [--batch 200] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def random_route(rng: random.Random, n: int):
+    """A wandering route of n points starting near Chennai."""
+    lat, lng = 13.08, 80.27
+    points = []
+    for _ in range(n):
+        lat += rng.uniform(-0.01, 0.01)
+        lng += rng.uniform(-0.01, 0.01)
+        points.append((lat, lng))
+    return points
+
+
+def check_equivalence(rng: random.Random, samples: int = 500) -> None:
+    """Fail loudly if the NumPy decoders ever differ from decode_polyline."""
+    strs = []
+    for _ in range(samples):
+        encoded = app.encode_polyline(random_route(rng, rng.randint(0, 50)))
+        cut = rng.randint(0, len(encoded)) if rng.random() < 0.5 else len(encoded)
+        strs.append(encoded[:cut])
+
+    for s, arr in zip(strs, app.decode_polylines(strs)):
+        expected = np.array(app.decode_polyline(s), dtype=np.float64).reshape(-1, 2)
+        if not np.array_equal(arr, expected) or not np.array_equal(app.decode_polyline_array(s), expected):
+            raise SystemExit(f"Mismatch decoding {s!r}")
+    print(f"equivalence: {samples} polylines (half truncated) decode identically")
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=20000, help="vertices in the long polyline")
+    parser.add_argument("--batch", type=int, default=200, help="polylines in the batch test")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    check_equivalence(rng)
+
+    long_polyline = app.encode_polyline(random_route(rng, args.points))
+    py = best_of(lambda: app.decode_polyline(long_polyline), args.repeat)
+    vec = best_of(lambda: app.decode_polyline_array(long_polyline), args.repeat)
+    print(f"single ({args.points} points, {len(long_polyline)} chars)")
+    print(f"  decode_polyline        {py * 1000:9.2f} ms")
+    print(f"  decode_polyline_array  {vec * 1000:9.2f} ms  ({py / vec:.1f}x)")
+
+    batch = [app.encode_polyline(random_route(rng, rng.randint(50, 500))) for _ in range(args.batch)]
+    py = best_of(lambda: [app.decode_polyline(s) for s in batch], args.repeat)
+    per = best_of(lambda: [app.decode_polyline_array(s) for s in batch], args.repeat)
+    vec = best_of(lambda: app.decode_polylines(batch), args.repeat)
+    print(f"batch ({args.batch} polylines)")
+    print(f"  decode_polyline        {py * 1000:9.2f} ms")
+    print(f"  decode_polyline_array  {per * 1000:9.2f} ms  ({py / per:.1f}x)")
+    print(f"  decode_polylines       {vec * 1000:9.2f} ms  ({py / vec:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
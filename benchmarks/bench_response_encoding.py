@@ -0,0 +1,121 @@
+"""
+Response encoding benchmark
+
+Builds a /plan-trip sized response of app.PlaceRecord stops (with opening
+hours and AI descriptions) and reports, for the full response and for the
+mobile projection that drops opening_hours and ai_details:
+
+  - encode time with the stdlib JSON encoder and with orjson (if installed),
+    after checking that both decode to the same object
+  - body size raw, gzip-compressed and brotli-compressed (if installed),
+    and the time compression adds
+
+Usage:
+    python benchmarks/bench_response_encoding.py [--stops 300] [--categories 3] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+CATEGORIES = ["Restaurant", "Beach", "Temple", "Park", "Cafe"]
+MOBILE_FIELDS = "-opening_hours,-ai_details"
+
+
+def random_response(rng: random.Random, categories: int, stops: int):
+    """A /plan-trip body with `stops` stops in each of `categories` categories."""
+    by_category = {}
+    for category in CATEGORIES[:categories]:
+        places = []
+        for i in range(stops):
+            place = app.PlaceRecord.from_result({
+                "place_id": f"ChIJ{i:012d}{rng.getrandbits(40):010x}",
+                "name": f"{category} {i}",
+                "geometry": {"location": {"lat": 12 + rng.random() * 2, "lng": 79 + rng.random() * 2}},
+                "vicinity": f"{rng.randint(1, 200)} Main Road, Town {rng.randint(1, 500)}",
+                "rating": round(rng.uniform(3, 5), 1),
+                "user_ratings_total": rng.randint(1, 5000),
+                "opening_hours": {"open_now": rng.random() < 0.7},
+                "types": ["point_of_interest", "establishment"],
+            })
+            place.distance_along_route_km = round(rng.uniform(0, 300), 2)
+            place.detour_km = round(rng.uniform(0, 10), 2)
+            if i < app.MAX_AI_PLACES_PER_CATEGORY:
+                place.ai_details = " ".join(rng.choice(["busy", "quiet", "scenic", "local", "famous", "crowded",
+                                                        "filter coffee", "sea view", "parking"])
+                                            for _ in range(90))
+            places.append(place)
+        by_category[category] = places
+    return {
+        "route": {"from": "Chennai", "to": "Pondicherry", "distance_km": 151.2, "duration_minutes": 190.0,
+                  "vehicle_type": "car", "trip_date": "2026-01-01", "via_places": [], "places_radius_km": 10,
+                  "ai_details_enabled": True},
+        "stops": by_category,
+        "partial": False,
+    }
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def encode_times(provider, body, repeat: int):
+    """(stdlib seconds, orjson seconds or None) to dump body through the app's JSON provider."""
+    saved = app.FAST_JSON
+    try:
+        app.FAST_JSON = False
+        stdlib = best_of(lambda: provider.dumps(body), repeat)
+        if app.orjson is None:
+            return stdlib, None
+        app.FAST_JSON = True
+        if json.loads(provider.dumps(body)) != json.loads(json.dumps(body, default=provider.default)):
+            raise SystemExit("orjson and the stdlib encoder disagree")
+        return stdlib, best_of(lambda: provider.dumps(body), repeat)
+    finally:
+        app.FAST_JSON = saved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", type=int, default=300, help="stops per category")
+    parser.add_argument("--categories", type=int, default=3, choices=range(1, len(CATEGORIES) + 1))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    provider = app.app.json
+    body = random_response(random.Random(42), args.categories, args.stops)
+    fields, _ = app.parse_stop_fields(MOBILE_FIELDS)
+    encodings = ["gzip"] + (["br"] if app.brotli is not None else [])
+
+    print(f"{args.categories} categories x {args.stops} stops"
+          f" (orjson {'installed' if app.orjson else 'not installed'},"
+          f" brotli {'installed' if app.brotli else 'not installed'})")
+    for label, response in (("full", body), (f"fields={MOBILE_FIELDS}", app.project_result(body, fields))):
+        data = provider.dumps(response).encode()
+        stdlib, fast = encode_times(provider, response, args.repeat)
+        print(label)
+        print(f"  raw                    {len(data):9d} B")
+        for encoding in encodings:
+            compressed = app.compress_body(data, encoding)
+            took = best_of(lambda: app.compress_body(data, encoding), args.repeat)
+            print(f"  {encoding:<22} {len(compressed):9d} B  ({len(data) / len(compressed):4.1f}x smaller,"
+                  f" {took * 1000:6.2f} ms)")
+        print(f"  encode stdlib json     {stdlib * 1000:9.2f} ms")
+        if fast is not None:
+            print(f"  encode orjson          {fast * 1000:9.2f} ms  ({stdlib / fast:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
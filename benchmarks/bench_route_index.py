@@ -0,0 +1,105 @@
+"""
+Route index microbenchmark
+
+Times building app.RouteIndex over a long route and locating stops on it,
+against scanning every segment for every stop, after checking that both
+find the same closest segment.
+
+Usage:
+    python benchmarks/bench_route_index.py [--points 30000] [--stops 500] [--cell-km 2.5] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def random_route(rng: random.Random, n: int):
+    """A route of n points heading north-east from Bangalore, wandering a little."""
+    lat, lng = 12.97, 77.59
+    points = []
+    for _ in range(n):
+        lat += rng.uniform(-0.0005, 0.0012)
+        lng += rng.uniform(-0.0008, 0.0012)
+        points.append((round(lat, 5), round(lng, 5)))
+    return points
+
+
+def random_stops(rng: random.Random, route, n: int, spread_deg: float = 0.1):
+    """n points scattered within about spread_deg of random route vertices."""
+    stops = []
+    for _ in range(n):
+        lat, lng = rng.choice(route)
+        stops.append((lat + rng.uniform(-spread_deg, spread_deg), lng + rng.uniform(-spread_deg, spread_deg)))
+    return stops
+
+
+def locate_by_scan(index: "app.RouteIndex", stops):
+    """What RouteIndex.locate answers, found by checking every segment for every stop."""
+    every_segment = [np.arange(len(index.points) - 1)]
+    located = []
+    for lat, lng in stops:
+        _, seg, t = index._nearest(every_segment, lng * index.kx, lat * app.KM_PER_DEGREE)
+        located.append(float(index.along[seg] + index.seg_km[seg] * t))
+    return located
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=30000, help="vertices in the route")
+    parser.add_argument("--stops", type=int, default=500, help="stops to locate")
+    parser.add_argument("--cell-km", type=float, default=2.5, help="grid cell size (10 km radius -> 2.5)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    route = np.array(random_route(rng, args.points))
+    stops = random_stops(rng, route.tolist(), args.stops)
+
+    index = app.RouteIndex(route, args.cell_km)
+    located = [index.locate(lat, lng)[0] for lat, lng in stops]
+    scanned = locate_by_scan(index, stops)
+    if any(abs(a - b) > 1e-6 for a, b in zip(located, scanned)):
+        raise SystemExit("RouteIndex.locate disagrees with a full scan")
+    print(f"equivalence: {args.stops} stops placed identically by the index and a full scan")
+
+    build = best_of(lambda: app.RouteIndex(route, args.cell_km), args.repeat)
+    query = best_of(lambda: [index.locate(lat, lng) for lat, lng in stops], args.repeat)
+    scan = best_of(lambda: locate_by_scan(index, stops), 1)
+    print(f"route: {args.points} points, {index.length_km:.0f} km, {len(index.grid)} cells of {args.cell_km} km")
+    print(f"  build index            {build * 1000:9.2f} ms")
+    print(f"  locate {args.stops} stops      {query * 1000:9.2f} ms")
+    print(f"  full scan (NumPy)      {scan * 1000:9.2f} ms  ({scan / query:.1f}x slower)")
+
+    saved, app.np = app.np, None
+    try:
+        plain = route.tolist()
+        py_index = app.RouteIndex(plain, args.cell_km)
+        build = best_of(lambda: app.RouteIndex(plain, args.cell_km), args.repeat)
+        query = best_of(lambda: [py_index.locate(lat, lng) for lat, lng in stops], args.repeat)
+    finally:
+        app.np = saved
+    print("without NumPy")
+    print(f"  build index            {build * 1000:9.2f} ms")
+    print(f"  locate {args.stops} stops      {query * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+/plan-trip load test
+
+Fires trip-planning requests at a running app.py from a pool of concurrent
+clients and reports throughput and latency percentiles. Run it against the
+local stub server (see stub_server.py) to catch performance regressions
+without touching the real Google/OpenAI APIs.
+
+    python benchmarks/stub_server.py --latency-ms 60 &
+    GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8600 GOOGLE_MAPS_API_KEY=stub python app.py &
+    python benchmarks/load_test.py --concurrency 32 --requests 400
+
+--unique makes every request a different trip so caches and request
+coalescing cannot help; --max-p95-ms makes the script exit non-zero when
+p95 latency goes over budget, for use in CI.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CITIES = ["Chennai", "Pondicherry", "Mahabalipuram", "Kanchipuram", "Vellore",
+          "Tirupati", "Bangalore", "Trichy", "Madurai", "Coimbatore"]
+PREFERENCES = ["Restaurant", "Veg Restaurant", "Beach", "Tourist attraction",
+               "Famous temples", "Children fun or play spot", "Famous food point"]
+RADII = [5, 10, 15, 25]
+
+
+def make_payload(rng: random.Random, unique: bool, index: int) -> dict:
+    from_place, to_place = rng.sample(CITIES, 2)
+    if unique:
+        # Addresses the stub does not know are geocoded to distinct spots
+        from_place = f"{from_place} depot {index}"
+    return {
+        "from_place": from_place,
+        "to_place": to_place,
+        "trip_date": "2025-12-20",
+        "vehicle_type": rng.choice(["car", "bike"]),
+        "preferences": rng.sample(PREFERENCES, rng.randint(1, 4)),
+        "places_radius_km": rng.choice(RADII),
+    }
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000/plan-trip")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="total requests to send")
+    parser.add_argument("--payload", help="JSON file with one payload or a list of payloads to cycle through")
+    parser.add_argument("--unique", action="store_true", help="make every trip distinct (defeats caching)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--max-p95-ms", type=float, help="exit 1 if p95 latency exceeds this")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.payload:
+        with open(args.payload, encoding="utf-8") as f:
+            loaded = json.load(f)
+        pool = loaded if isinstance(loaded, list) else [loaded]
+        payloads = [pool[i % len(pool)] for i in range(args.requests)]
+    else:
+        payloads = [make_payload(rng, args.unique, i) for i in range(args.requests)]
+
+    local = threading.local()
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def send(payload):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            status = session.post(args.url, json=payload, timeout=args.timeout).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(send, payloads))
+    wall = time.perf_counter() - wall_started
+
+    ordered = sorted(latencies)
+    report = {
+        "requests": len(ordered),
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(ordered) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordered), 1) if ordered else 0.0,
+            "p50": round(percentile(ordered, 50), 1),
+            "p95": round(percentile(ordered, 95), 1),
+            "p99": round(percentile(ordered, 99), 1),
+            "max": round(ordered[-1], 1) if ordered else 0.0,
+        },
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        lat = report["latency_ms"]
+        print(f"{report['requests']} requests, concurrency {args.concurrency}, {report['wall_seconds']} s")
+        print(f"throughput  {report['throughput_rps']} req/s")
+        print(f"latency ms  p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+        print(f"statuses    {report['statuses']}")
+
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        print(f"p95 {report['latency_ms']['p95']} ms exceeds budget {args.max_p95_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
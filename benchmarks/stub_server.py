@@ -0,0 +1,320 @@
+"""
+Local stand-in for the Google Maps and OpenAI endpoints used by app.py
+
+Serves Geocoding, Directions, Places Nearby Search and the OpenAI Responses
+API with payloads shaped like the real services, so app.py can be
+benchmarked offline without spending API quota. Geocoding answers come
+from recorded fixtures (fixtures/google_maps.json), with unknown addresses
+placed deterministically. Routes follow the straight line between the
+endpoints with a little wobble, and places are generated deterministically
+around each query centre.
+
+Latency and failures can be injected, globally or per API:
+
+    python benchmarks/stub_server.py --port 8600 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+
+    curl -X POST localhost:8600/__stub/config -d '{"places": {"latency_ms": 400}}'
+
+Point app.py at it with:
+
+    GOOGLE_MAPS_BASE_URL=http://localhost:8600 GOOGLE_MAPS_API_KEY=stub \\
+    OPENAI_BASE_URL=http://localhost:8600/v1 OPENAI_API_KEY=stub python app.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import encode_polyline, haversine_km, normalize_address  # noqa: E402
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "google_maps.json")
+
+stub = Flask(__name__)
+
+with open(FIXTURES_PATH, encoding="utf-8") as f:
+    FIXTURES = json.load(f)
+
+APIS = ("geocode", "directions", "places", "openai")
+
+# Per-API injection settings; edited at runtime through /__stub/config
+_config_lock = threading.Lock()
+CONFIG = {api: {"latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0, "error_status": 503} for api in APIS}
+STATS = {api: {"requests": 0, "errors": 0} for api in APIS}
+
+
+def _seeded(*parts) -> random.Random:
+    """Deterministic RNG so identical queries get identical answers."""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def _inject(api: str):
+    """Sleep for the configured latency; return an error response to send instead, if any."""
+    with _config_lock:
+        cfg = dict(CONFIG[api])
+        STATS[api]["requests"] += 1
+    delay = cfg["latency_ms"] + random.uniform(-cfg["jitter_ms"], cfg["jitter_ms"])
+    if delay > 0:
+        time.sleep(delay / 1000)
+    if cfg["error_rate"] and random.random() < cfg["error_rate"]:
+        with _config_lock:
+            STATS[api]["errors"] += 1
+        return jsonify({"error_message": "Injected failure", "status": "UNKNOWN_ERROR"}), cfg["error_status"]
+    return None
+
+
+def _parse_latlng(value: str):
+    lat, lng = value.replace("via:", "").split(",")
+    return float(lat), float(lng)
+
+
+def _geocode_result(address: str):
+    key = normalize_address(address)
+    for name, result in FIXTURES["geocode"].items():
+        if key == name or key.startswith(name + ","):
+            return result
+
+    # Unknown addresses land somewhere in South India, always at the same spot
+    rng = _seeded("geocode", key)
+    lat, lng = rng.uniform(8.5, 16.0), rng.uniform(76.0, 80.3)
+    title = address.strip().title()
+    return {
+        "address_components": [{"long_name": title, "short_name": title, "types": ["locality", "political"]}],
+        "formatted_address": f"{title}, India",
+        "geometry": {
+            "location": {"lat": round(lat, 7), "lng": round(lng, 7)},
+            "location_type": "APPROXIMATE",
+            "viewport": {"northeast": {"lat": round(lat + 0.05, 7), "lng": round(lng + 0.05, 7)},
+                         "southwest": {"lat": round(lat - 0.05, 7), "lng": round(lng - 0.05, 7)}},
+        },
+        "place_id": "Stub" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:23],
+        "types": ["locality", "political"],
+    }
+
+
+@stub.route("/maps/api/geocode/json")
+def geocode():
+    error = _inject("geocode")
+    if error:
+        return error
+    address = request.args.get("address", "")
+    if not address or normalize_address(address).startswith("nowhere"):
+        return jsonify({"results": [], "status": "ZERO_RESULTS"})
+    return jsonify({"results": [_geocode_result(address)], "status": "OK"})
+
+
+def _route_points(stops, rng):
+    """Road-like polyline through the stops: a vertex every ~300 m with a slight wobble."""
+    points = [stops[0]]
+    for a, b in zip(stops, stops[1:]):
+        n = max(2, int(haversine_km(a, b) / 0.3))
+        for i in range(1, n + 1):
+            f = i / n
+            wobble = 0.0 if i == n else math.sin(f * math.pi * 6) * 0.01 + rng.uniform(-0.001, 0.001)
+            points.append((a[0] + (b[0] - a[0]) * f + wobble, a[1] + (b[1] - a[1]) * f - wobble))
+    return points
+
+
+@stub.route("/maps/api/directions/json")
+def directions():
+    error = _inject("directions")
+    if error:
+        return error
+    origin = _parse_latlng(request.args["origin"])
+    destination = _parse_latlng(request.args["destination"])
+    via = [_parse_latlng(w) for w in request.args.get("waypoints", "").split("|") if w]
+    stops = [origin] + via + [destination]
+
+    rng = _seeded("directions", request.args["origin"], request.args["destination"],
+                  request.args.get("waypoints", ""), request.args.get("mode", "driving"))
+    points = _route_points(stops, rng)
+    meters = int(sum(haversine_km(a, b) for a, b in zip(points, points[1:])) * 1000)
+    speed_mps = {"driving": 13.0, "bicycling": 4.5, "walking": 1.3}.get(request.args.get("mode"), 13.0)
+
+    return jsonify({
+        "geocoded_waypoints": [{"geocoder_status": "OK", "place_id": "Stub" + uuid.uuid4().hex[:23],
+                                "types": ["locality", "political"]} for _ in stops],
+        "routes": [{
+            "bounds": {
+                "northeast": {"lat": max(p[0] for p in points), "lng": max(p[1] for p in points)},
+                "southwest": {"lat": min(p[0] for p in points), "lng": min(p[1] for p in points)},
+            },
+            "copyrights": "Map data ©2025 Stub",
+            "legs": [{
+                "distance": {"text": f"{meters / 1000:.0f} km", "value": meters},
+                "duration": {"text": f"{meters / speed_mps / 3600:.0f} hours", "value": int(meters / speed_mps)},
+                "start_location": {"lat": origin[0], "lng": origin[1]},
+                "end_location": {"lat": destination[0], "lng": destination[1]},
+                "steps": [],
+                "via_waypoint": [],
+            }],
+            "overview_polyline": {"points": encode_polyline(points)},
+            "summary": "Stub Highway",
+            "warnings": [],
+            "waypoint_order": [],
+        }],
+        "status": "OK",
+    })
+
+
+@stub.route("/maps/api/place/nearbysearch/json")
+def nearby_search():
+    error = _inject("places")
+    if error:
+        return error
+    lat, lng = _parse_latlng(request.args["location"])
+    radius_m = float(request.args.get("radius", 5000))
+    place_type = request.args.get("type", "point_of_interest")
+    keyword = request.args.get("keyword", "")
+
+    # Places live on a ~2 km grid so neighbouring queries overlap like real results do
+    names = FIXTURES["place_names"].get(place_type, FIXTURES["place_names"]["tourist_attraction"])
+    template = FIXTURES["nearby_result_template"]
+    step = 0.02
+    reach = int(radius_m / 1000 / 2.2) + 1
+    gi, gj = round(lat / step), round(lng / step)
+
+    results = []
+    for di in range(-reach, reach + 1):
+        for dj in range(-reach, reach + 1):
+            rng = _seeded("place", place_type, gi + di, gj + dj)
+            if rng.random() > 0.35:
+                continue
+            plat = (gi + di) * step + rng.uniform(-0.008, 0.008)
+            plng = (gj + dj) * step + rng.uniform(-0.008, 0.008)
+            if haversine_km((lat, lng), (plat, plng)) * 1000 > radius_m:
+                continue
+            name = f"{rng.choice(names)} {rng.choice(['', 'Junction', 'Main Road', 'Highway', 'Town'])}".strip()
+            if keyword and not any(k in name.lower() for k in keyword.lower().split()) and rng.random() < 0.6:
+                continue
+
+            place = json.loads(json.dumps(template))
+            pid = "ChIJStub" + hashlib.sha1(f"{place_type}{gi + di}{gj + dj}".encode()).hexdigest()[:19]
+            place.update({
+                "name": name,
+                "place_id": pid,
+                "reference": pid,
+                "rating": round(rng.uniform(3.2, 4.9), 1),
+                "user_ratings_total": int(rng.paretovariate(1.2) * 40),
+                "types": [place_type, "point_of_interest", "establishment"],
+                "vicinity": f"{rng.randint(1, 250)}, {rng.choice(['Main Rd', 'ECR', 'GST Rd', 'Beach Rd'])}",
+                "plus_code": {"compound_code": f"{pid[-4:]}+XX Stub", "global_code": f"7J{pid[-6:]}+XX"},
+            })
+            place["geometry"]["location"] = {"lat": round(plat, 7), "lng": round(plng, 7)}
+            place["geometry"]["viewport"] = {
+                "northeast": {"lat": round(plat + 0.0013, 7), "lng": round(plng + 0.0013, 7)},
+                "southwest": {"lat": round(plat - 0.0013, 7), "lng": round(plng - 0.0013, 7)},
+            }
+            if rng.random() < 0.3:
+                del place["opening_hours"]
+            results.append(place)
+
+    results.sort(key=lambda p: haversine_km((lat, lng), (p["geometry"]["location"]["lat"],
+                                                           p["geometry"]["location"]["lng"])))
+    return jsonify({"html_attributions": [], "results": results[:20], "status": "OK" if results else "ZERO_RESULTS"})
+
+
+def _describe(name: str) -> str:
+    return (f"{name} is a well-loved stop along the route, known for its atmosphere and easy access. "
+            f"Travellers often plan a short break here.\n"
+            "- Easy to reach from the highway\n- Consistently good reviews\n- Great photo opportunities\n"
+            "Ideal audience: families, couples and solo travellers.")
+
+
+@stub.route("/v1/responses", methods=["POST"])
+def responses():
+    error = _inject("openai")
+    if error:
+        return error
+    body = request.get_json(silent=True) or {}
+    prompt = body.get("input", "")
+    if isinstance(prompt, list):
+        prompt = json.dumps(prompt)
+
+    wants_json = ((body.get("text") or {}).get("format") or {}).get("type") == "json_object"
+    if wants_json:
+        ids = []
+        for line in prompt.splitlines():
+            line = line.strip()
+            if line.startswith('"place_id":'):
+                ids.append(line.split('"')[3])
+        text = json.dumps({pid: _describe(pid) for pid in ids})
+    else:
+        name = next((l.split(":", 1)[1].strip() for l in prompt.splitlines() if l.startswith("Name:")), "This place")
+        text = _describe(name)
+
+    input_tokens = max(1, len(prompt) // 4)
+    output_tokens = max(1, len(text) // 4)
+    return jsonify({
+        "id": "resp_" + uuid.uuid4().hex,
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": body.get("model", "stub"),
+        "output": [{
+            "id": "msg_" + uuid.uuid4().hex,
+            "type": "message",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    })
+
+
+@stub.route("/__stub/config", methods=["GET", "POST"])
+def stub_config():
+    """GET current settings and counters; POST {"<api>|all": {"latency_ms": ..., ...}} to change them."""
+    if request.method == "POST":
+        updates = request.get_json(silent=True) or {}
+        with _config_lock:
+            for api, values in updates.items():
+                for target in (APIS if api == "all" else [api]):
+                    if target in CONFIG:
+                        CONFIG[target].update({k: v for k, v in values.items() if k in CONFIG[target]})
+    with _config_lock:
+        return jsonify({"config": CONFIG, "stats": STATS})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="mean injected latency for every API")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="uniform +/- jitter around the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--openai-latency-ms", type=float, default=None, help="override latency for /v1/responses")
+    args = parser.parse_args()
+
+    for api in APIS:
+        CONFIG[api].update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, error_status=args.error_status)
+    if args.openai_latency_ms is not None:
+        CONFIG["openai"]["latency_ms"] = args.openai_latency_ms
+
+    stub.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
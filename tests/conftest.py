@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Keep the test run off the on-disk caches and the upstream rate limits
+os.environ.setdefault("GEOCODE_CACHE_PATH", "")
+os.environ.setdefault("AI_CACHE_PATH", "")
+for api in ("PLACES", "GEOCODE", "DIRECTIONS"):
+    os.environ.setdefault(f"{api}_QPS", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def slow_openai(monkeypatch):
+    """An OpenAI-compatible stub that answers after 2 s, with app.openai_client pointed at it."""
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            hits.append(self.path)
+            time.sleep(2)
+            self.send_response(500)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(app, "openai_enabled", True)
+    monkeypatch.setattr(app, "openai_client",
+                        app.build_openai_client("test", f"http://127.0.0.1:{server.server_port}/v1"))
+    yield hits
+    server.shutdown()
+
+
+def place(place_id="p1"):
+    return app.PlaceRecord.from_result({"place_id": place_id, "name": "Marina Beach",
+                                        "geometry": {"location": {"lat": 13.05, "lng": 80.28}}})
+
+
+def test_slow_completion_is_cut_off_at_the_call_timeout(slow_openai):
+    started = time.perf_counter()
+    assert app.generate_place_details_with_ai(place(), "Beach", use_cache=False, timeout=0.5) is None
+    assert time.perf_counter() - started < 1.5
+    assert len(slow_openai) == 1
+
+
+@pytest.mark.parametrize("batch_mode", [True, False])
+def test_descriptions_from_either_prompt_serve_both_modes(batch_mode):
+    per_place, batched, missing = place("pp"), place("bb"), place("mm")
+    app.ai_cache.set("pp", "Beach", "per-place text")
+    app.ai_cache.set("bb", "Beach", "batch text", prompt_hash=app.AI_BATCH_PROMPT_HASH)
+
+    filled, pending = app.split_cached_ai_details({"Beach": [per_place, batched, missing]},
+                                                  app.ai_prompt_hashes(batch_mode))
+    assert [p.ai_details for _, p in filled] == ["per-place text", "batch text"]
+    assert pending == [(missing, "Beach")]
+
+
+def test_timed_out_batch_falls_back_to_per_place_calls(monkeypatch):
+    def slow_batch(items, timeout=None):
+        time.sleep(2)
+        return {p.place_id: "late" for p, _ in items}
+
+    monkeypatch.setattr(app, "generate_batch_details_with_ai", slow_batch)
+    pending = [(place("a"), "Beach"), (place("b"), "Beach")]
+    assert app._enrich_in_batches(pending, app.Deadline(0.1)) == pending
+
+
+def test_malformed_batch_output_is_logged(caplog):
+    assert app.parse_batch_output({"a": {}}, "not json") is None
+    assert "not valid JSON" in caplog.text
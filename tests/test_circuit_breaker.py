@@ -0,0 +1,138 @@
+import time
+import types
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock for app; advance it with clock.now += seconds."""
+    fake = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(app, "time", types.SimpleNamespace(
+        monotonic=lambda: fake.now, perf_counter=time.perf_counter, time=time.time, sleep=time.sleep))
+    return fake
+
+
+def breaker():
+    return app.CircuitBreaker("test", error_rate=0.5, min_requests=4, window_seconds=30, open_seconds=10)
+
+
+def trip(b):
+    for ok in (True, False, False, True):
+        assert b.allow()
+        b.record(ok)
+
+
+def test_opens_at_the_error_rate_and_fails_fast(clock):
+    b = breaker()
+    for ok in (True, True, True, False, False):
+        b.record(ok)
+    assert b.state == "closed"   # 2 of 5 failed
+    b.record(False)
+    assert b.state == "open"     # 3 of 6 failed
+    assert not b.allow()
+
+
+def test_failures_age_out_of_the_window(clock):
+    b = breaker()
+    b.record(False)
+    b.record(False)
+    clock.now += 31
+    for _ in range(3):
+        b.record(True)
+    b.record(False)
+    assert b.state == "closed"
+
+
+def test_half_open_probe_closes_on_success(clock):
+    b = breaker()
+    trip(b)
+    assert b.state == "open"
+    clock.now += 10
+    assert b.allow()
+    assert b.state == "half_open"
+    assert not b.allow()   # one probe at a time
+    b.record(True, clock.now)
+    assert b.state == "closed"
+    assert b.allow()
+
+
+def test_half_open_probe_reopens_on_failure(clock):
+    b = breaker()
+    trip(b)
+    clock.now += 10
+    assert b.allow()
+    b.record(False, clock.now)
+    assert b.state == "open"
+    clock.now += 5
+    assert not b.allow()
+
+
+def test_lost_probe_is_replaced_after_a_cool_down(clock):
+    b = breaker()
+    trip(b)
+    clock.now += 10
+    assert b.allow()
+    clock.now += 5
+    assert not b.allow()
+    clock.now += 5
+    assert b.allow()
+
+
+def test_call_started_before_the_probe_does_not_decide_it(clock):
+    b = breaker()
+    trip(b)
+    straggler_started = clock.now - 1
+    clock.now += 10
+    assert b.allow()
+    b.record(True, straggler_started)
+    assert b.state == "half_open"
+    b.record(False, clock.now)
+    assert b.state == "open"
+
+
+@pytest.fixture
+def hedged(monkeypatch):
+    """Hedging on for "places" (50 ms delay); app._send answers per URL after the given seconds."""
+    window = app.LatencyWindow()
+    for _ in range(app.HEDGE_MIN_SAMPLES):
+        window.add(0.01)
+    monkeypatch.setitem(app.latency_windows, "places", window)
+    sent = []
+
+    def send(url, params, api, timeout, deadline=None):
+        delay = params["delays"][len(sent)]
+        sent.append(url)
+        time.sleep(delay)
+        return f"answer {len(sent)}"
+
+    monkeypatch.setattr(app, "_send", send)
+    return sent
+
+
+def hedges(result):
+    return app.UPSTREAM_HEDGES._values.get(("places", result), 0)
+
+
+def test_fast_call_is_not_hedged(hedged):
+    assert app._hedged_send("u", {"delays": [0.0]}, "places", 1.0) == "answer 1"
+    assert len(hedged) == 1
+
+
+def test_slow_call_is_hedged_and_the_hedge_wins(hedged):
+    won = hedges("won")
+    assert app._hedged_send("u", {"delays": [0.5, 0.0]}, "places", 1.0) == "answer 2"
+    assert len(hedged) == 2
+    assert hedges("won") == won + 1
+
+
+def test_hedge_is_skipped_without_rate_budget(monkeypatch, hedged):
+    bucket = app.TokenBucket(0.001, burst=1)
+    assert bucket.acquire(0)
+    monkeypatch.setitem(app.rate_limiters, "places", bucket)
+    skipped = hedges("skipped")
+    assert app._hedged_send("u", {"delays": [0.2]}, "places", 1.0) == "answer 1"
+    assert len(hedged) == 1
+    assert hedges("skipped") == skipped + 1
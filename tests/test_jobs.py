@@ -0,0 +1,15 @@
+import app
+
+
+def test_cancel_before_run_finishes_job():
+    """A cancel that lands after a worker took the job, but before it started, still finishes the job."""
+    store = app.JobStore(max_workers=1, max_pending=1, ttl_seconds=60, max_finished=10)
+    job = app.TripJob({})
+    store._jobs[job.id] = job
+    job.cancel_requested = True
+
+    store._run(job)
+
+    assert job.status == "cancelled"
+    assert job.finished_at is not None
+    assert job.finished   # so it no longer counts against max_pending and can expire
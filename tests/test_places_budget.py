@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import app
+
+POINTS = [(13.0 + i * 0.2, 80.0) for i in range(10)]
+CATEGORIES = ["Restaurant", "Beach", "Famous temples"]
+
+
+def drained_bucket(rate):
+    bucket = app.TokenBucket(rate, burst=1)
+    assert bucket.acquire(0)
+    return bucket
+
+
+def test_token_bucket_waits_for_the_next_token():
+    bucket = drained_bucket(20)
+    started = time.monotonic()
+    assert bucket.acquire(1.0)
+    assert 0.03 < time.monotonic() - started < 0.5
+
+
+def test_token_bucket_rejects_without_waiting_when_the_token_comes_too_late():
+    bucket = drained_bucket(1)
+    started = time.monotonic()
+    assert not bucket.acquire(0)
+    assert not bucket.acquire(0.2)
+    assert time.monotonic() - started < 0.1
+
+
+def test_rate_limited_places_call_comes_back_as_429(monkeypatch):
+    monkeypatch.setitem(app.rate_limiters, "places", drained_bucket(0.001))
+    monkeypatch.setattr(app, "REQUEST_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(app.http_session, "get", lambda *a, **k: pytest.fail("call was not rate-limited"))
+    call = app.nearby_search(13.0, 80.0, "restaurant", None, 5000)
+    assert call["status"] == 429
+    assert call["results"] == []
+
+
+@pytest.mark.parametrize("limit, expected", [(0, []), (1, [5]), (2, [0, 10]), (3, [0, 5, 10]), (20, list(range(11)))])
+def test_thin_points_spreads_the_kept_points(limit, expected):
+    assert app.thin_points(list(range(11)), limit) == expected
+
+
+def test_budget_thins_the_sweep_and_marks_the_trip_partial():
+    sweep = app.PlacesSweep(POINTS, CATEGORIES, 5000, max_calls=12)
+    stats = sweep.stats()
+    assert stats["budget_limited"]
+    assert stats["planned_calls"] <= 12
+    assert (stats["sample_points"], stats["searched_points"]) == (10, 4)
+    assert sweep.centres[0] == POINTS[0] and sweep.centres[-1] == POINTS[-1]
+
+    params = {"preferences": CATEGORIES, "max_latency_ms": None}
+    stops, partial_reasons, incomplete = app.summarise_places(params, {c: [] for c in CATEGORIES}, [], stats,
+                                                              app.Deadline())
+    assert partial_reasons == ["places_call_budget"]
+    assert incomplete == []
+
+
+def test_sweep_within_budget_is_not_partial():
+    stats = app.PlacesSweep(POINTS, CATEGORIES, 5000, max_calls=30).stats()
+    assert not stats["budget_limited"]
+    assert stats["searched_points"] == 10
@@ -0,0 +1,78 @@
+import pytest
+
+import app
+
+POINTS = [(13.0 + i * 0.2, 80.0) for i in range(10)]
+
+
+def place(place_id, name):
+    return app.PlaceRecord.from_result({"place_id": place_id, "name": name,
+                                        "geometry": {"location": {"lat": 13.0, "lng": 80.0}}})
+
+
+def call(*places, status=200):
+    return {"status": status, "results": list(places)}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake Nearby Search recording (type, keyword) per call."""
+    seen = []
+
+    def search(lat, lng, place_type, keyword, radius_meters, deadline=None):
+        seen.append((place_type, keyword))
+        name = "Veg Bhavan" if keyword is None else f"{keyword} place"
+        return call(place(f"{lat},{keyword}", name))
+
+    monkeypatch.setattr(app, "cached_nearby_search", search)
+    return seen
+
+
+@pytest.mark.parametrize("categories", [
+    ["Veg Restaurant", "Famous food point"],
+    ["Restaurant", "Veg Restaurant", "Famous food point"],
+    ["Restaurant", "Beach", "Tourist attraction"],
+])
+@pytest.mark.parametrize("shared", [True, False])
+def test_planner_never_adds_calls_or_phases(monkeypatch, upstream, categories, shared):
+    monkeypatch.setattr(app, "PLANNER_SHARED_QUERIES", shared)
+    stats = {}
+    found = dict(app.iter_places_for_categories(POINTS, categories, 5000, concurrency=4, plan_stats=stats))
+    assert sorted(found) == sorted(categories)
+    assert len(upstream) == stats["planned_calls"] == len(categories) * len(POINTS)
+    assert stats["calls_saved"] == 0
+
+
+def test_keyword_only_groups_send_no_unfiltered_query():
+    queries = app.plan_places_queries(["Veg Restaurant", "Famous food point"])
+    assert [q["keyword"] for q in queries] == ["veg vegetarian", "famous special popular"]
+    assert all(not q["keyword_categories"] for q in queries)
+
+
+def test_identical_queries_are_shared(monkeypatch, upstream):
+    monkeypatch.setitem(app.CATEGORY_MAPPING, "Dhaba", {"type": "restaurant", "keywords": []})
+    stats = {}
+    found = dict(app.iter_places_for_categories(POINTS, ["Restaurant", "Dhaba"], 5000, plan_stats=stats))
+    assert len(upstream) == len(POINTS)
+    assert stats["calls_saved"] == len(POINTS)
+    assert [p.place_id for p in found["Restaurant"]] == [p.place_id for p in found["Dhaba"]]
+
+
+def test_keyword_category_adds_client_side_matches_once_both_queries_finish():
+    sweep = app.PlacesSweep(POINTS[:2], ["Restaurant", "Veg Restaurant"], 5000)
+    unfiltered, veg = sweep.queries
+    assert unfiltered["keyword_categories"] == ["Veg Restaurant"]
+
+    assert sweep.resolve(veg, [call(place("a", "Annapoorna"), place("b", "Saravana Bhavan"))]) == []
+    ready = dict(sweep.resolve(unfiltered, [call(place("b", "Saravana Bhavan Veg"), place("c", "Pure Veg Meals"),
+                                                  place("d", "Grill House")), call(status=504)]))
+    assert [p.place_id for p in ready["Restaurant"]] == ["b", "c", "d"]
+    assert [p.place_id for p in ready["Veg Restaurant"]] == ["a", "b", "c"]
+
+
+def test_keyword_category_keeps_its_own_results_without_the_unfiltered_query():
+    sweep = app.PlacesSweep(POINTS[:2], ["Restaurant", "Veg Restaurant"], 5000)
+    _, veg = sweep.queries
+    assert sweep.resolve(veg, [call(place("a", "Annapoorna"))]) == []
+    stops, = dict(sweep.unfinished()).values()
+    assert [p.place_id for p in stops] == ["a"]
@@ -0,0 +1,116 @@
+import math
+import random
+
+import pytest
+
+import app
+
+
+def brute_force_locate(index, lat, lng):
+    """Distance along the route to the closest segment, found by checking every one in the index's projection."""
+    qx, qy = lng * index.kx, lat * app.KM_PER_DEGREE
+    best = (math.inf, 0, 0.0)
+    for i in range(len(index.points) - 1):
+        ax, ay = float(index.x[i]), float(index.y[i])
+        dx, dy = float(index.x[i + 1]) - ax, float(index.y[i + 1]) - ay
+        length2 = dx * dx + dy * dy
+        t = min(1.0, max(0.0, ((qx - ax) * dx + (qy - ay) * dy) / length2)) if length2 > 0 else 0.0
+        d2 = (ax + t * dx - qx) ** 2 + (ay + t * dy - qy) ** 2
+        if d2 < best[0]:
+            best = (d2, i, t)
+    _, seg, t = best
+    return float(index.along[seg] + index.seg_km[seg] * t)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        if app.np is None:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(app, "np", None)
+    return request.param
+
+
+def test_empty_route(backend):
+    index = app.RouteIndex([], 2.5)
+    assert index.locate(13.0, 80.0) is None
+    assert index.length_km == 0.0
+
+
+def test_single_vertex_route(backend):
+    index = app.RouteIndex([(13.08, 80.27)], 2.5)
+    along, detour = index.locate(13.18, 80.27)
+    assert along == 0.0
+    assert detour == pytest.approx(app.haversine_km((13.18, 80.27), (13.08, 80.27)))
+
+
+def test_two_vertex_route(backend):
+    points = [(13.08, 80.27), (13.08, 80.37)]
+    index = app.RouteIndex(points, 2.5)
+    along, detour = index.locate(13.1, 80.32)
+    assert along == pytest.approx(index.length_km / 2, rel=1e-3)
+    assert detour == pytest.approx(app.haversine_km((13.1, 80.32), (13.08, 80.32)), rel=1e-3)
+
+
+def test_segments_longer_than_cells(backend):
+    # A coarse overview polyline: every segment spans several cells
+    points = [(13.0 + i * 0.5, 80.0 + (i % 2) * 0.5) for i in range(8)]
+    index = app.RouteIndex(points, 5.0)
+    rng = random.Random(7)
+    for _ in range(50):
+        lat, lng = 13.0 + rng.uniform(-0.5, 4.0), 80.0 + rng.uniform(-0.5, 1.0)
+        assert index.locate(lat, lng)[0] == pytest.approx(brute_force_locate(index, lat, lng), abs=1e-6)
+
+
+def test_random_routes_match_brute_force(backend):
+    rng = random.Random(42)
+    for _ in range(30):
+        lat, lng = 12.0, 79.0
+        points = []
+        for _ in range(rng.randint(2, 40)):
+            lat += rng.uniform(-0.2, 0.3)
+            lng += rng.uniform(-0.2, 0.3)
+            points.append((lat, lng))
+        index = app.RouteIndex(points, rng.choice([0.5, 2.5, 10.0]))
+        for _ in range(10):
+            qlat, qlng = rng.choice(points)
+            qlat, qlng = qlat + rng.uniform(-0.3, 0.3), qlng + rng.uniform(-0.3, 0.3)
+            expected = brute_force_locate(index, qlat, qlng)
+            assert index.locate(qlat, qlng)[0] == pytest.approx(expected, abs=1e-6)
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.status_code = 200
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def test_plan_trip_to_the_same_place(monkeypatch):
+    """A trip whose route collapses to one point still plans (no segments to index)."""
+    def fake_get(url, params=None, timeout=None, **kwargs):
+        if "geocode" in url:
+            return FakeResponse({"status": "OK", "results": [{
+                "formatted_address": "Chennai, Tamil Nadu, India",
+                "geometry": {"location": {"lat": 13.0827, "lng": 80.2707}}}]})
+        if "directions" in url:
+            return FakeResponse({"status": "OK", "routes": [{
+                "legs": [{"distance": {"value": 0}, "duration": {"value": 0}}],
+                "overview_polyline": {"points": app.encode_polyline([(13.0827, 80.2707)])}}]})
+        lat, lng = map(float, params["location"].split(","))
+        return FakeResponse({"status": "OK", "results": [{
+            "place_id": f"{params.get('type')}-{params.get('keyword')}", "name": "Marina Beach",
+            "geometry": {"location": {"lat": lat + 0.01, "lng": lng}}, "vicinity": "Chennai",
+            "rating": 4.5, "user_ratings_total": 1000, "types": ["natural_feature"]}]})
+
+    monkeypatch.setattr(app, "GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(app.http_session, "get", fake_get)
+    response = app.app.test_client().post("/plan-trip", json={
+        "from_place": "Chennai", "to_place": "Chennai", "trip_date": "2026-01-01",
+        "vehicle_type": "car", "preferences": ["Beach"], "stops_order": "detour"})
+    assert response.status_code == 200, response.get_json()
+    stops = response.get_json()["stops"]["Beach"]
+    assert stops and stops[0]["distance_along_route_km"] == 0.0
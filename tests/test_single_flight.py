@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import app
+
+
+def in_thread(fn, *args):
+    """Start fn(*args) in a thread; returns a dict filled with its "result" or "error"."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn(*args)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    outcome["thread"] = thread
+    return outcome
+
+
+def test_follower_gives_up_at_its_own_deadline():
+    flight = app.SingleFlight("test")
+    release = threading.Event()
+    leader = in_thread(flight.do_within, None, "k", lambda d: release.wait(5) and "answer")
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    with pytest.raises(app.DeadlineExceeded):
+        flight.do_within(app.Deadline(0.1), "k", lambda d: "not called")
+    assert time.monotonic() - started < 0.5
+
+    release.set()
+    leader["thread"].join(5)
+    assert leader["result"] == "answer"
+    assert flight.stats() == {"executed": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_short_leader_deadline_does_not_cut_the_call_short_for_followers():
+    flight = app.SingleFlight("test")
+    seen = []
+
+    def call(deadline):
+        time.sleep(0.3)
+        seen.append(deadline.expires_at)
+        return "answer"
+
+    leader = in_thread(flight.do_within, app.Deadline(0.1), "k", call)
+    time.sleep(0.05)
+    follower = in_thread(flight.do_within, app.Deadline(5), "k", call)
+    follower_none = in_thread(flight.do_within, None, "k", call)
+    for caller in (leader, follower, follower_none):
+        caller["thread"].join(5)
+
+    assert isinstance(leader["error"], app.DeadlineExceeded)
+    assert follower["result"] == follower_none["result"] == "answer"
+    assert seen == [None]   # the no-deadline follower lifted the flight's deadline
+
+
+def test_flight_deadline_only_extends():
+    short, long = app.Deadline(1), app.Deadline(10)
+    deadline = app.FlightDeadline(long)
+    deadline.extend(short)
+    assert deadline.expires_at == long.expires_at
+    deadline.extend(None)
+    assert deadline.expires_at is None
+    deadline.extend(short)
+    assert deadline.expires_at is None
+
+
+def test_retry_backoff_stops_at_the_deadline():
+    assert app.retry_backoff(0) is not None
+    assert app.retry_backoff(app.HTTP_MAX_RETRIES) is None
+    assert app.retry_backoff(0, app.Deadline(60)) is not None
+    assert app.retry_backoff(0, app.Deadline(app.HTTP_BACKOFF_SECONDS / 2)) is None
+
+
+@pytest.fixture
+def unavailable_upstream(monkeypatch):
+    """Every attempt through the retry-less session answers 503; returns the attempt times."""
+    attempts = []
+
+    def get(url, params=None, timeout=None):
+        attempts.append(time.monotonic())
+        resp = requests.Response()
+        resp.status_code = 503
+        return resp
+
+    monkeypatch.setattr(app.http_session_no_retries, "get", get)
+    return attempts
+
+
+def test_send_retries_while_the_deadline_leaves_room(unavailable_upstream):
+    resp = app._send("http://upstream.test", {}, "other", 1.0, app.Deadline(60))
+    assert resp.status_code == 503
+    assert len(unavailable_upstream) == app.HTTP_MAX_RETRIES + 1
+
+
+def test_send_skips_retries_the_deadline_cannot_fit(unavailable_upstream):
+    started = time.monotonic()
+    resp = app._send("http://upstream.test", {}, "other", 1.0, app.Deadline(app.HTTP_BACKOFF_SECONDS / 2))
+    assert resp.status_code == 503
+    assert len(unavailable_upstream) == 1
+    assert time.monotonic() - started < app.HTTP_BACKOFF_SECONDS
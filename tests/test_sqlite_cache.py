@@ -0,0 +1,20 @@
+import app
+
+
+def test_database_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = app.SQLiteCache(str(path), "entries")
+    assert not path.exists()
+
+    cache.set("k", {"v": 1}, ttl_seconds=60)
+    assert path.exists()
+    assert cache.get("k")[0] == {"v": 1}
+    assert len(cache) == 1
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    app.SQLiteCache(path, "entries").set("k", "v", ttl_seconds=60)
+    reopened = app.SQLiteCache(path, "entries")
+    assert reopened.get("k")[0] == "v"
+    assert reopened.get("missing") is None